@@ -0,0 +1,204 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+
+_DONE = object()
+
+OUT_FORMATS = ("png", "jpg", "webp")
+
+SHARD = 32  # frames per pool task
+
+_fallback_clahe = None
+
+
+def fallback_clahe():
+    """CLAHE for the near-black fallback, built on first use and reused (only dark frames need it)."""
+    global _fallback_clahe
+    if _fallback_clahe is None:
+        _fallback_clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+    return _fallback_clahe
+
+
+def encode_params(out_format, png_compression=1):
+    """cv2.imwrite flags for an --out_format (JPEG q95 without the extra Huffman pass, lossless WebP)."""
+    if out_format == "jpg":
+        return [cv2.IMWRITE_JPEG_QUALITY, 95, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+    if out_format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, 101]  # >100 selects lossless
+    return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+
+
+def out_rel(rel, out_format):
+    """Output path for input path rel: the same name for png, the extension swapped otherwise."""
+    if out_format == "png":
+        return rel
+    return os.path.splitext(rel)[0] + "." + out_format
+
+
+def willneed(path):
+    """Asks the kernel to start reading path into the page cache (no-op where unsupported)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # let the real read report it
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_manifest(path):
+    """
+    Parses a TUM-style rgb.txt in a single read.
+
+    Output
+      header: the '#' comment lines before the first frame, newline-terminated, to start the
+              output manifest with
+      items: (ts, rel) per frame, in file order
+      notes: later '#' lines by the index of the frame they precede (len(items): after the
+             last one), so they can be written back where they appeared
+    """
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    header, items, notes = [], [], {}
+    for ln in lines:
+        if ln.startswith("#"):
+            (notes.setdefault(len(items), []) if items else header).append(ln + "\n")
+        elif ln.strip():
+            ts, rel = ln.split()
+            items.append((ts, rel))
+    return header, items, notes
+
+
+def shards(items, size):
+    """Splits items into contiguous lists of at most `size` entries."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_pipeline(items, read, process, write, readers=2, writers=2, maxsize=8, path=None):
+    """
+    Runs read -> process -> write over items with decode and encode on background
+    threads, so the calling thread only does the per-frame compute.
+
+    Inputs
+      items: per-frame work descriptors (e.g. (ts, rel) tuples)
+      read(item): returns the decoded frame, or None to skip the item
+      process(item, data): returns the frame to write
+      write(item, result): writes the frame; its return value is collected
+      readers, writers: thread counts for the I/O stages
+      maxsize: bound of each inter-stage queue (frames held in memory)
+      path(item): optional file path of an item; the feeder then hints the kernel to
+                  read files up to 2*maxsize frames ahead of the decoders
+
+    Output
+      results: list with write()'s return value per item, in input order
+               (None for items whose read returned None)
+    """
+    results = [None] * len(items)
+    read_q = queue.Queue(maxsize=maxsize)
+    write_q = queue.Queue(maxsize=maxsize)
+    errors = []
+
+    # Reads are submitted in order; the bounded queue caps how far they run ahead.
+    read_pool = ThreadPoolExecutor(max_workers=readers)
+
+    ahead = 2 * maxsize
+
+    def feed():
+        if path is not None:
+            for item in items[:ahead]:
+                willneed(path(item))
+        for i, item in enumerate(items):
+            if path is not None and i + ahead < len(items):
+                willneed(path(items[i + ahead]))
+            read_q.put((i, item, read_pool.submit(read, item)))
+        read_q.put(_DONE)
+
+    def drain():
+        while True:
+            job = write_q.get()
+            if job is _DONE:
+                write_q.put(_DONE)  # let the sibling writers stop too
+                return
+            i, item, res = job
+            try:
+                results[i] = write(item, res)
+            except Exception as e:
+                errors.append(e)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    drainers = [threading.Thread(target=drain, daemon=True) for _ in range(max(1, writers))]
+    feeder.start()
+    for t in drainers:
+        t.start()
+    try:
+        while True:
+            job = read_q.get()
+            if job is _DONE:
+                break
+            i, item, fut = job
+            data = fut.result()
+            if data is None:
+                continue
+            write_q.put((i, item, process(item, data)))
+    finally:
+        write_q.put(_DONE)
+        for t in drainers:
+            t.join()
+        read_pool.shutdown(wait=False, cancel_futures=True)
+    if errors:
+        raise errors[0]
+    return results
+
+
+# ---------- process pool (one run_pipeline per shard) ----------
+_stages = None
+
+
+def _init_pool_worker(stages, init, initargs):
+    global _stages
+    # one OpenCV thread per process, the pool already uses every core
+    cv2.setNumThreads(1)
+    _stages = stages
+    if init is not None:
+        init(*initargs)
+
+
+def _run_shard(shard):
+    # decode/encode run on I/O threads while this process does the per-frame compute
+    read, process, write, path = _stages
+    return run_pipeline(shard, read, process, write, path=path)
+
+
+def frame_pool(workers, read, process, write, path=None, init=None, initargs=(), mp_context=None):
+    """
+    Process pool for map_frames: each worker runs init(*initargs) once, then read -> process
+    -> write (see run_pipeline) over the shards it is handed.
+
+    Inputs
+      workers: number of processes
+      read, process, write, path: the run_pipeline stages, module-level functions
+      init, initargs: per-worker setup, e.g. building the operator objects that cannot be pickled
+      mp_context: multiprocessing context (default: the platform's)
+    """
+    return ProcessPoolExecutor(max_workers=max(1, workers), mp_context=mp_context,
+                               initializer=_init_pool_worker,
+                               initargs=((read, process, write, path), init, initargs))
+
+
+def map_frames(pool, items, shard=SHARD):
+    """
+    Yields (item, result) for every item, in input order; result is write()'s return value,
+    or None when read() returned None.
+    """
+    # map() yields shards in input order, so outputs such as rgb.txt stay sorted like the input
+    chunks = shards(items, shard)
+    for chunk, results in zip(chunks, pool.map(_run_shard, chunks)):
+        yield from zip(chunk, results)
@@ -0,0 +1,45 @@
+"""
+Pieces shared by proposed_itmo.py and proposed_tmo.py: the optional numba setup and the
+tiling helpers of their NumPy paths. The operators load this file from their own directory,
+so it has to travel with them (e.g. when they are passed by --itmo-path / --tmo-path).
+"""
+import numpy as np
+
+try:
+    import numba
+    from numba import njit, prange
+    # The kernels are bound by pow(), which numba only vectorizes through SVML; without it every
+    # call is a scalar libm pow and NumPy's SIMD power loops win, so keep the NumPy path there.
+    USE_NUMBA = bool(numba.config.USING_SVML)
+except ImportError:  # optional: fall back to the NumPy path
+    USE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+TILE = 256  # tile edge: 256*256*3 float32 = 768 KB, so a tile's temporaries stay in L2
+
+
+def tiles(shape):
+    """
+    Yields index tuples covering an H×W pixel grid in TILE×TILE blocks; a (..., H, W) grid,
+    e.g. a B-frame batch, is tiled frame by frame so the working set stays one tile.
+    """
+    if len(shape) < 2:
+        yield (Ellipsis,)
+        return
+    H, W = shape[-2:]
+    for lead in np.ndindex(shape[:-2]):
+        for y0 in range(0, H, TILE):
+            for x0 in range(0, W, TILE):
+                yield lead + np.s_[y0:y0 + TILE, x0:x0 + TILE]
+
+
+def mix3(m, src, out, tmp):
+    """out[..., i] = sum_j m[i][j] * src[j]: planar (3×H×W) in, interleaved H×W×3 out (tmp: H×W scratch)."""
+    for i in range(3):
+        o = out[..., i]
+        np.multiply(src[0], m[i][0], out=o)
+        o += np.multiply(src[1], m[i][1], out=tmp)
+        o += np.multiply(src[2], m[i][2], out=tmp)
@@ -1,24 +1,96 @@
 #!/usr/bin/env python3
-import argparse, os, cv2, numpy as np
+import argparse, multiprocessing, os, cv2, numpy as np
+from frame_pipeline import OUT_FORMATS, encode_params, frame_pool, map_frames, out_rel, read_manifest
 
 def ensure_dir(p): os.makedirs(p, exist_ok=True)
 
-def process_img(bgr, clipLimit=3.0, tileGridSize=8):
+def make_clahe(clipLimit=3.0, tileGridSize=8):
+    return cv2.createCLAHE(clipLimit=float(clipLimit), tileGridSize=(int(tileGridSize), int(tileGridSize)))
+
+def process_img(bgr, clahe):
+    # clahe: a cv2.CLAHE built once by make_clahe() and reused across frames
     lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)
     l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=float(clipLimit), tileGridSize=(int(tileGridSize), int(tileGridSize)))
     l2 = clahe.apply(l)
     lab2 = cv2.merge([l2, a, b])
     return cv2.cvtColor(lab2, cv2.COLOR_LAB2BGR)
 
+# ---------- CUDA path (OpenCV built with CUDA) ----------
+def cuda_available():
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+def make_clahe_cuda(clipLimit=3.0, tileGridSize=8):
+    return cv2.cuda.createCLAHE(clipLimit=float(clipLimit), tileGridSize=(int(tileGridSize), int(tileGridSize)))
+
+def process_img_cuda(bgr, clahe, gpu, stream):
+    # gpu: a cv2.cuda_GpuMat reused for every upload; all steps are queued on one stream
+    gpu.upload(bgr, stream)
+    lab = cv2.cuda.cvtColor(gpu, cv2.COLOR_BGR2LAB, stream=stream)
+    l, a, b = cv2.cuda.split(lab, stream=stream)
+    l2 = clahe.apply(l, stream)
+    lab2 = cv2.cuda.merge([l2, a, b], stream=stream)
+    out = cv2.cuda.cvtColor(lab2, cv2.COLOR_LAB2BGR, stream=stream).download(stream)
+    stream.waitForCompletion()
+    return out
+
+# ---------- worker stages (one set per process, see frame_pipeline.frame_pool) ----------
+_cfg = {}
+
+def _init_worker(in_seq, out_seq, clipLimit, tileGridSize, use_cuda, out_format, png_compression):
+    _cfg.update(in_seq=in_seq, out_seq=out_seq, use_cuda=use_cuda,
+                out_format=out_format, encode=encode_params(out_format, png_compression))
+    if use_cuda:
+        _cfg.update(clahe=make_clahe_cuda(clipLimit, tileGridSize),
+                    gpu=cv2.cuda_GpuMat(), stream=cv2.cuda_Stream())
+    else:
+        _cfg.update(clahe=make_clahe(clipLimit, tileGridSize))
+
+def _path(item):
+    ts, rel = item
+    return os.path.join(_cfg["in_seq"], rel)
+
+def _read(item):
+    return cv2.imread(_path(item), cv2.IMREAD_COLOR)
+
+def _process(item, bgr):
+    if _cfg["use_cuda"]:
+        return process_img_cuda(bgr, _cfg["clahe"], _cfg["gpu"], _cfg["stream"])
+    return process_img(bgr, _cfg["clahe"])
+
+def _write(item, bgrp):
+    # keep same filename (extension follows --out_format)
+    ts, rel = item
+    out_path = os.path.join(_cfg["out_seq"], out_rel(rel, _cfg["out_format"]))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    cv2.imwrite(out_path, bgrp, _cfg["encode"])
+    return True
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in_seq", required=True, help="Input TUM-style folder (contains rgb/ and rgb.txt)")
     ap.add_argument("--out_seq", required=True, help="Output folder to write processed rgb/ + rgb.txt")
     ap.add_argument("--clipLimit", type=float, default=3.0)
     ap.add_argument("--tileGridSize", type=int, default=8)
+    ap.add_argument("--out_format", choices=OUT_FORMATS, default="png",
+                    help="Output image format (jpg/webp rename the frames and rgb.txt entries)")
+    ap.add_argument("--png_compression", type=int, default=1, help="zlib level for png output (0-9)")
+    ap.add_argument("--device", choices=["auto", "cpu", "cuda"], default="auto",
+                    help="Where CLAHE runs; auto uses CUDA when OpenCV has a CUDA device")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Worker processes (default: all cores on CPU, 1 on CUDA)")
     args = ap.parse_args()
 
+    use_cuda = args.device != "cpu" and cuda_available()
+    if args.device == "cuda" and not use_cuda:
+        raise SystemExit("--device cuda: OpenCV was built without CUDA or no CUDA device is visible")
+    if args.workers is None:
+        # on CUDA the GPU does the compute; one process keeps a single CUDA context and
+        # its I/O threads still decode/encode around the GPU work
+        args.workers = 1 if use_cuda else os.cpu_count()
+
     in_rgb = os.path.join(args.in_seq, "rgb")
     in_list = os.path.join(args.in_seq, "rgb.txt")
     if not os.path.isdir(in_rgb) or not os.path.isfile(in_list):
@@ -27,29 +99,26 @@ def main():
     out_rgb = os.path.join(args.out_seq, "rgb")
     ensure_dir(out_rgb)
 
-    # write header
+    # parse the manifest first, then fan the frames out to the pool
+    header, items, notes = read_manifest(in_list)
+
     out_list = os.path.join(args.out_seq, "rgb.txt")
-    with open(in_list, "r") as fin, open(out_list, "w") as fout:
-        for line in fin:
-            if not line.strip() or line.startswith("#"):
-                if line.startswith("#"):
-                    fout.write(line)
+    out_lines = list(header)
+    # cuda_available() has initialized CUDA in this process, and CUDA cannot be used in a
+    # child forked after that: CUDA workers are spawned and set up their own context
+    ctx = multiprocessing.get_context("spawn") if use_cuda else None
+    with frame_pool(args.workers, _read, _process, _write, _path, init=_init_worker,
+                    initargs=(args.in_seq, args.out_seq, args.clipLimit, args.tileGridSize, use_cuda,
+                              args.out_format, args.png_compression), mp_context=ctx) as pool:
+        for i, ((ts, rel), ok) in enumerate(map_frames(pool, items)):
+            out_lines += notes.get(i, ())
+            if not ok:
+                print(f"[WARN] failed to read {os.path.join(args.in_seq, rel)}")
                 continue
-            ts, rel = line.strip().split()
-            src_path = os.path.join(args.in_seq, rel)
-            bgr = cv2.imread(src_path, cv2.IMREAD_COLOR)
-            if bgr is None:
-                print(f"[WARN] failed to read {src_path}")
-                continue
-            bgrp = process_img(bgr, args.clipLimit, args.tileGridSize)
-
-            # keep same filename
-            out_rel = rel
-            out_path = os.path.join(args.out_seq, out_rel)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, bgrp, [cv2.IMWRITE_PNG_COMPRESSION, 3])
-
-            fout.write(f"{ts} {out_rel}\n")
+            out_lines.append(f"{ts} {out_rel(rel, args.out_format)}\n")
+    out_lines += notes.get(len(items), ())
+    with open(out_list, "w") as fout:
+        fout.writelines(out_lines)
 
 if __name__ == "__main__":
     main()
@@ -1,29 +1,94 @@
 #!/usr/bin/env python3
-import argparse, os, cv2, numpy as np
+import argparse, os, shutil, cv2, numpy as np
+from functools import lru_cache
+from frame_pipeline import (OUT_FORMATS, encode_params, fallback_clahe, frame_pool, map_frames, out_rel,
+                            read_manifest)
 
 def ensure_dir(p): os.makedirs(p, exist_ok=True)
 
+@lru_cache(maxsize=None)
+def exposure_lut(g, gm):
+    """256-entry uint8 -> float32 table for one (gain, gamma) exposure."""
+    f = np.arange(256, dtype=np.uint8).astype(np.float32) / 255.0
+    x = np.clip(f * float(g), 0.0, 1.0)
+    # apply gamma after gain to adjust mid-tones
+    lut = np.power(x, float(gm), dtype=np.float32)
+    lut.flags.writeable = False
+    return lut
+
 def synthesize_exposures(bgr, gains=(0.5, 1.0, 2.0), gammas=(1.1, 1.0, 0.9)):
     """
     Create 3 exposures from a single LDR image using linear gain + gentle gamma.
     Returns a list of float32 BGR images in [0,1].
+    Each exposure is one cv2.LUT call (all channels, float32 table) on the uint8 input.
     """
-    f = bgr.astype(np.float32) / 255.0
-    outs = []
-    for g, gm in zip(gains, gammas):
-        x = np.clip(f * float(g), 0.0, 1.0)
-        # apply gamma after gain to adjust mid-tones
-        x = np.power(x, float(gm), dtype=np.float32)
-        outs.append(np.ascontiguousarray(x))
-    return outs
+    return [cv2.LUT(bgr, exposure_lut(float(g), float(gm))) for g, gm in zip(gains, gammas)]
+
+def fuse_exposures(exposures, mertens):
+    """Fusion step only: run a prebuilt cv2.MergeMertens on already synthesized exposures."""
+    out = mertens.process(exposures)  # float32, may overshoot [0,1] slightly
+    out *= 255.0
+    np.clip(out, 0.0, 255.0, out=out)
+    return out.astype(np.uint8)
 
 def fuse_mertens(bgr, contrast_w=1.0, sat_w=1.0, exp_w=0.75,
                  gains=(0.5,1.0,2.0), gammas=(1.1,1.0,0.9)):
     exposures = synthesize_exposures(bgr, gains=gains, gammas=gammas)
     mertens = cv2.createMergeMertens(float(contrast_w), float(sat_w), float(exp_w))
-    out = mertens.process(exposures)  # float32 [0,1]
-    out = np.clip(out * 255.0, 0.0, 255.0).astype(np.uint8)
-    return out
+    return fuse_exposures(exposures, mertens)
+
+# ---------- worker stages (one set per process, see frame_pipeline.frame_pool) ----------
+_cfg = {}
+
+def _init_worker(in_seq, out_seq, weights, gains, gammas, out_format, png_compression):
+    for g, gm in zip(gains, gammas):
+        exposure_lut(float(g), float(gm))  # build the tables once, up front
+    contrast_w, sat_w, exp_w = (float(w) for w in weights)
+    # the near-black retry only raises the exposure weight; with exp_w >= 1 it is a no-op
+    retry = cv2.createMergeMertens(contrast_w, sat_w, 1.0) if exp_w < 1.0 else None
+    _cfg.update(in_seq=in_seq, out_seq=out_seq, gains=gains, gammas=gammas,
+                out_format=out_format, encode=encode_params(out_format, png_compression),
+                mertens=cv2.createMergeMertens(contrast_w, sat_w, exp_w), mertens_retry=retry)
+
+def _path(item):
+    ts, rel = item
+    return os.path.join(_cfg["in_seq"], rel)
+
+def _read(item):
+    return cv2.imread(_path(item), cv2.IMREAD_COLOR)
+
+def _process(item, bgr):
+    # exposures are synthesized once; the retry below only re-runs the fusion
+    exposures = synthesize_exposures(bgr, gains=_cfg["gains"], gammas=_cfg["gammas"])
+    fused = fuse_exposures(exposures, _cfg["mertens"])
+
+    # defensive: if near-black, retry with higher exposure weight; if still bad, fall back to CLAHE
+    if fused.mean() < 2.0 and _cfg["mertens_retry"] is not None:  # ~dark
+        fused_retry = fuse_exposures(exposures, _cfg["mertens_retry"])
+        if fused_retry.mean() > fused.mean():
+            fused = fused_retry
+    if fused.mean() < 2.0:
+        # CLAHE fallback on L channel
+        lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)
+        l, a, c = cv2.split(lab)
+        l2 = fallback_clahe().apply(l)
+        fused = cv2.cvtColor(cv2.merge([l2, a, c]), cv2.COLOR_LAB2BGR)
+    return fused
+
+def _write(item, fused):
+    ts, rel = item
+    out_path = os.path.join(_cfg["out_seq"], out_rel(rel, _cfg["out_format"]))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    cv2.imwrite(out_path, fused, _cfg["encode"])
+    return float(fused.mean())
+
+def save_debug(out_path, dbg_path):
+    """Copies a written output frame to _debug/ as PNG (a jpg output gives its decoded pixels)."""
+    if out_path.endswith(".png"):
+        shutil.copyfile(out_path, dbg_path)
+    else:
+        # debug frames are throwaway: store them uncompressed
+        cv2.imwrite(dbg_path, cv2.imread(out_path, cv2.IMREAD_COLOR), [cv2.IMWRITE_PNG_COMPRESSION, 0])
 
 def main():
     ap = argparse.ArgumentParser()
@@ -34,8 +99,14 @@ def main():
     ap.add_argument("--exp_weight", type=float, default=0.75)
     ap.add_argument("--gains", type=str, default="0.5,1.0,2.0")   # comma-separated
     ap.add_argument("--gammas", type=str, default="1.1,1.0,0.9")  # comma-separated
-    ap.add_argument("--max_frames", type=int, default=0, help="Process first N frames (0=all)")
-    ap.add_argument("--debug_every", type=int, default=0, help="Save every Nth fused frame to _debug/")
+    ap.add_argument("--max_frames", type=int, default=0,
+                    help="Stop after N successfully processed frames (0=all); unreadable entries do not count")
+    ap.add_argument("--debug_every", type=int, default=0,
+                    help="Save every Nth processed frame to _debug/frame_<N>.png")
+    ap.add_argument("--out_format", choices=OUT_FORMATS, default="png",
+                    help="Output image format (jpg/webp rename the frames and rgb.txt entries)")
+    ap.add_argument("--png_compression", type=int, default=1, help="zlib level for png output (0-9)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
     args = ap.parse_args()
 
     gains = tuple(float(v) for v in args.gains.split(","))
@@ -57,61 +128,44 @@ def main():
     if args.debug_every > 0:
         ensure_dir(dbg_dir)
 
+    # parse the manifest first, then fan the frames out to the pool
+    header, items, notes = read_manifest(in_list)
+
     processed = 0
-    with open(in_list, "r") as fin, open(out_list, "w") as fout:
-        for line in fin:
-            if not line.strip() or line.startswith("#"):
-                if line.startswith("#"):
-                    fout.write(line)
-                continue
-            ts, rel = line.strip().split()
-            src_path = os.path.join(args.in_seq, rel)
-            bgr = cv2.imread(src_path, cv2.IMREAD_COLOR)
-            if bgr is None:
-                print(f"failed to read {src_path}")
-                continue
-
-            fused = fuse_mertens(
-                bgr,
-                contrast_w=args.contrast_weight,
-                sat_w=args.sat_weight,
-                exp_w=args.exp_weight,
-                gains=gains, gammas=gammas
-            )
-
-            # defensive: if near-black, retry with higher exposure weight; if still bad, fall back to CLAHE
-            if fused.mean() < 2.0:  # ~dark
-                fused_retry = fuse_mertens(
-                    bgr,
-                    contrast_w=args.contrast_weight,
-                    sat_w=args.sat_weight,
-                    exp_w=max(args.exp_weight, 1.0),
-                    gains=gains, gammas=gammas
-                )
-                if fused_retry.mean() > fused.mean():
-                    fused = fused_retry
-            if fused.mean() < 2.0:
-                # CLAHE fallback on L channel
-                lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)
-                l, a, c = cv2.split(lab)
-                clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-                l2 = clahe.apply(l)
-                fused = cv2.cvtColor(cv2.merge([l2, a, c]), cv2.COLOR_LAB2BGR)
-
-            out_rel = rel
-            out_path = os.path.join(args.out_seq, out_rel)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, fused, [cv2.IMWRITE_PNG_COMPRESSION, 3])
-            fout.write(f"{ts} {out_rel}\n")
-
-            processed += 1
-            if args.debug_every > 0 and processed % args.debug_every == 0:
-                cv2.imwrite(os.path.join(dbg_dir, f"frame_{processed:06d}.png"), fused)
-
-            if args.max_frames and processed >= args.max_frames:
+    mean = 0.0
+    weights = (args.contrast_weight, args.sat_weight, args.exp_weight)
+    out_lines = list(header)
+    # with --max_frames, take the next entries still needed until N frames were processed
+    # (or the manifest runs out), so unreadable entries do not count towards N
+    todo = items[:args.max_frames] if args.max_frames else items
+    rest = items[len(todo):]
+    seen = 0  # manifest entries consumed so far, to place the notes
+    with frame_pool(args.workers, _read, _process, _write, _path, init=_init_worker,
+                    initargs=(args.in_seq, args.out_seq, weights, gains, gammas,
+                              args.out_format, args.png_compression)) as pool:
+        while todo:
+            for (ts, rel), mean_i in map_frames(pool, todo):
+                out_lines += notes.get(seen, ())
+                seen += 1
+                if mean_i is None:
+                    print(f"failed to read {os.path.join(args.in_seq, rel)}")
+                    continue
+                out_lines.append(f"{ts} {out_rel(rel, args.out_format)}\n")
+                processed += 1
+                mean = mean_i
+                # debug frames are numbered by processed count, so only known here
+                if args.debug_every > 0 and processed % args.debug_every == 0:
+                    save_debug(os.path.join(args.out_seq, out_rel(rel, args.out_format)),
+                               os.path.join(dbg_dir, f"frame_{processed:06d}.png"))
+            if not args.max_frames:
                 break
-
-    print(f"Processed {processed} frames. Example mean intensity: {fused.mean():.2f}")
+            need = args.max_frames - processed
+            todo, rest = rest[:need], rest[need:]
+    if seen == len(items):
+        out_lines += notes.get(seen, ())
+    with open(out_list, "w") as fout:
+        fout.writelines(out_lines)
+
+    print(f"Processed {processed} frames. Example mean intensity: {mean:.2f}")
 if __name__ == "__main__":
     main()
-
@@ -1,18 +1,53 @@
 #!/usr/bin/env python3
 import argparse, os, cv2, numpy as np
+from frame_pipeline import OUT_FORMATS, encode_params, frame_pool, map_frames, out_rel, read_manifest
 
 def ensure_dir(p): os.makedirs(p, exist_ok=True)
 
-def process_img(bgr, gamma=1.0, intensity=0.0, light_adapt=0.8, color_adapt=0.2):
+def make_tonemap(gamma=1.0, intensity=0.0, light_adapt=0.8, color_adapt=0.2):
+    return cv2.createTonemapReinhard(gamma=float(gamma),
+                                     intensity=float(intensity),
+                                     light_adapt=float(light_adapt),
+                                     color_adapt=float(color_adapt))
+
+def process_img(bgr, tmo, intensity):
+    # tmo: a cv2.TonemapReinhard built once by make_tonemap() and reused across frames.
+    # process() overwrites the object's intensity with exp(-intensity), so reset it
+    # every frame to get the same result as a freshly built object. intensity must be
+    # the value passed to make_tonemap(): the object cannot report its original setting.
+    tmo.setIntensity(float(intensity))
     # OpenCV's TonemapReinhard expects float32 in [0,1]
-    f = bgr.astype(np.float32) / 255.0
-    tmo = cv2.createTonemapReinhard(gamma=float(gamma),
-                                    intensity=float(intensity),
-                                    light_adapt=float(light_adapt),
-                                    color_adapt=float(color_adapt))
+    f = bgr.astype(np.float32)
+    f /= 255.0                    # scale in place, no second buffer
     out = tmo.process(f)          # float32 [0,1]
-    out = np.clip(out * 255.0, 0, 255).astype(np.uint8)
-    return out
+    out *= 255.0
+    np.clip(out, 0, 255, out=out)
+    return out.astype(np.uint8)
+
+# ---------- worker stages (one set per process, see frame_pipeline.frame_pool) ----------
+# The tonemap object is not picklable, so each worker builds its own in _init_worker.
+_cfg = {}
+
+def _init_worker(in_seq, out_seq, params, out_format, png_compression):
+    _cfg.update(in_seq=in_seq, out_seq=out_seq, tonemap=make_tonemap(*params), intensity=params[1],
+                out_format=out_format, encode=encode_params(out_format, png_compression))
+
+def _path(item):
+    ts, rel = item
+    return os.path.join(_cfg["in_seq"], rel)
+
+def _read(item):
+    return cv2.imread(_path(item), cv2.IMREAD_COLOR)
+
+def _process(item, bgr):
+    return process_img(bgr, _cfg["tonemap"], _cfg["intensity"])
+
+def _write(item, bgrp):
+    ts, rel = item
+    out_path = os.path.join(_cfg["out_seq"], out_rel(rel, _cfg["out_format"]))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    cv2.imwrite(out_path, bgrp, _cfg["encode"])
+    return True
 
 def main():
     ap = argparse.ArgumentParser()
@@ -22,6 +57,10 @@ def main():
     ap.add_argument("--intensity", type=float, default=0.0)
     ap.add_argument("--light_adapt", type=float, default=0.8)
     ap.add_argument("--color_adapt", type=float, default=0.2)
+    ap.add_argument("--out_format", choices=OUT_FORMATS, default="png",
+                    help="Output image format (jpg/webp rename the frames and rgb.txt entries)")
+    ap.add_argument("--png_compression", type=int, default=1, help="zlib level for png output (0-9)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
     args = ap.parse_args()
 
     in_rgb = os.path.join(args.in_seq, "rgb")
@@ -33,24 +72,22 @@ def main():
     ensure_dir(out_rgb)
     out_list = os.path.join(args.out_seq, "rgb.txt")
 
-    with open(in_list, "r") as fin, open(out_list, "w") as fout:
-        for line in fin:
-            if not line.strip() or line.startswith("#"):
-                if line.startswith("#"):
-                    fout.write(line)
-                continue
-            ts, rel = line.strip().split()
-            src_path = os.path.join(args.in_seq, rel)
-            bgr = cv2.imread(src_path, cv2.IMREAD_COLOR)
-            if bgr is None:
-                print(f"failed to read {src_path}")
+    # parse the manifest first, then fan the frames out to the pool
+    header, items, notes = read_manifest(in_list)
+
+    params = (args.gamma, args.intensity, args.light_adapt, args.color_adapt)
+    out_lines = list(header)
+    with frame_pool(args.workers, _read, _process, _write, _path, init=_init_worker,
+                    initargs=(args.in_seq, args.out_seq, params, args.out_format, args.png_compression)) as pool:
+        for i, ((ts, rel), ok) in enumerate(map_frames(pool, items)):
+            out_lines += notes.get(i, ())
+            if not ok:
+                print(f"failed to read {os.path.join(args.in_seq, rel)}")
                 continue
-            bgrp = process_img(bgr, args.gamma, args.intensity, args.light_adapt, args.color_adapt)
-            out_rel = rel
-            out_path = os.path.join(args.out_seq, out_rel)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            cv2.imwrite(out_path, bgrp, [cv2.IMWRITE_PNG_COMPRESSION, 3])
-            fout.write(f"{ts} {out_rel}\n")
+            out_lines.append(f"{ts} {out_rel(rel, args.out_format)}\n")
+    out_lines += notes.get(len(items), ())
+    with open(out_list, "w") as fout:
+        fout.writelines(out_lines)
 
 if __name__ == "__main__":
     main()
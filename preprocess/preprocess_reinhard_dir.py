@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import argparse, os, sys
 import numpy as np, cv2
+from frame_pipeline import OUT_FORMATS, encode_params, fallback_clahe, frame_pool, map_frames, out_rel
 
 def to_uint8(img):
     if img is None: return None
@@ -10,6 +11,54 @@ def to_uint8(img):
         return cv2.convertScaleAbs(img, alpha=255.0/float(info.max))
     return (np.clip(img,0.0,1.0)*255.0).astype(np.uint8)
 
+# ---------- worker stages (one set per process, see frame_pipeline.frame_pool) ----------
+# cv2.Tonemap objects are not picklable: each worker builds its own in _init_worker.
+_cfg = {}
+
+def _init_worker(in_dir, out_dir, gamma, intensity, light_adapt, color_adapt, out_format, png_compression):
+    _cfg.update(in_dir=in_dir, out_dir=out_dir, intensity=float(intensity),
+                out_format=out_format, encode=encode_params(out_format, png_compression),
+                tonemap=cv2.createTonemapReinhard(gamma=float(gamma),
+                                                  intensity=float(intensity),
+                                                  light_adapt=float(light_adapt),
+                                                  color_adapt=float(color_adapt)))
+
+def _path(name):
+    return os.path.join(_cfg["in_dir"], name)
+
+def _read(name):
+    src = _path(name)
+    img = cv2.imread(src, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        print("cannot read:", src, file=sys.stderr)
+    return img
+
+def _process(name, img):
+    img8 = to_uint8(img)
+    # work in BGR float32 0..1 (Reinhard expects 3 channels)
+    if img8.ndim == 2: bgr = cv2.cvtColor(img8, cv2.COLOR_GRAY2BGR)
+    else:              bgr = img8
+    f = bgr.astype(np.float32)
+    f /= 255.0                           # scale in place, no second buffer
+    # process() overwrites the tonemap's intensity with exp(-intensity); reset it so
+    # every frame is mapped with the requested value, whichever worker handles it
+    _cfg["tonemap"].setIntensity(_cfg["intensity"])
+    out = _cfg["tonemap"].process(f)     # float32 0..1
+    np.clip(out,0.0,1.0,out=out)
+    out *= 255.0
+    out8 = out.astype(np.uint8)
+    # for ORB-SLAM3, grayscale is fine (and closer to baseline)
+    gray = cv2.cvtColor(out8, cv2.COLOR_BGR2GRAY)
+    # safeguard: if too dark, fallback to CLAHE
+    if float(gray.mean()) < 2.0:
+        gray = fallback_clahe().apply(to_uint8(img if img.ndim==2 else cv2.cvtColor(img8,cv2.COLOR_BGR2GRAY)))
+    return gray
+
+def _write(name, gray):
+    ok = cv2.imwrite(os.path.join(_cfg["out_dir"], out_rel(name, _cfg["out_format"])), gray, _cfg["encode"])
+    if not ok:
+        print("failed to write:", name, file=sys.stderr)
+
 def main():
     ap = argparse.ArgumentParser(description="Reinhard global TMO: directory→directory (keeps filenames)")
     ap.add_argument("--in_dir",  required=True)
@@ -18,6 +67,10 @@ def main():
     ap.add_argument("--intensity", type=float, default=0.0)
     ap.add_argument("--light_adapt", type=float, default=0.8)
     ap.add_argument("--color_adapt", type=float, default=0.2)
+    ap.add_argument("--out_format", choices=OUT_FORMATS, default="png",
+                    help="Output image format (png keeps the input names; EuRoC loaders expect <ts>.png)")
+    ap.add_argument("--png_compression", type=int, default=1, help="zlib level for png output (0-9)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: all cores)")
     args = ap.parse_args()
 
     os.makedirs(args.out_dir, exist_ok=True)
@@ -26,34 +79,13 @@ def main():
     if not files:
         print("No images in", args.in_dir, file=sys.stderr)
 
-    tonemap = cv2.createTonemapReinhard(gamma=float(args.gamma),
-                                        intensity=float(args.intensity),
-                                        light_adapt=float(args.light_adapt),
-                                        color_adapt=float(args.color_adapt))
-
-    for i,name in enumerate(files,1):
-        src = os.path.join(args.in_dir, name)
-        img = cv2.imread(src, cv2.IMREAD_UNCHANGED)
-        if img is None:
-            print("cannot read:", src, file=sys.stderr); continue
-        img8 = to_uint8(img)
-        # work in BGR float32 0..1 (Reinhard expects 3 channels)
-        if img8.ndim == 2: bgr = cv2.cvtColor(img8, cv2.COLOR_GRAY2BGR)
-        else:              bgr = img8
-        f = bgr.astype(np.float32)/255.0
-        out = tonemap.process(f)     # float32 0..1
-        out8 = (np.clip(out,0.0,1.0)*255.0).astype(np.uint8)
-        # for ORB-SLAM3, grayscale is fine (and closer to baseline)
-        gray = cv2.cvtColor(out8, cv2.COLOR_BGR2GRAY)
-        # safeguard: if too dark, fallback to CLAHE
-        if float(gray.mean()) < 2.0:
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            gray = clahe.apply(to_uint8(img if img.ndim==2 else cv2.cvtColor(img8,cv2.COLOR_BGR2GRAY)))
-        ok = cv2.imwrite(os.path.join(args.out_dir, name), gray)
-        if not ok:
-            print("failed to write:", name, file=sys.stderr)
-        if i % 200 == 0:
-            print(f"[{i}/{len(files)}] {name}")
+    with frame_pool(args.workers, _read, _process, _write, _path, init=_init_worker,
+                    initargs=(args.in_dir, args.out_dir, args.gamma, args.intensity,
+                              args.light_adapt, args.color_adapt,
+                              args.out_format, args.png_compression)) as pool:
+        for done, (name, _) in enumerate(map_frames(pool, files), 1):
+            if done % 200 == 0:
+                print(f"[{done}/{len(files)}] {name}")
     print(f"Wrote {len(files)} images → {args.out_dir}")
 if __name__ == "__main__":
     main()
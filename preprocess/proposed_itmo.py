@@ -1,5 +1,28 @@
+import importlib.util
+import math
+import os
+import sys
+from functools import lru_cache
+
 import numpy as np
 
+try:
+    import operator_common  # noqa: F401
+except ModuleNotFoundError:  # loaded by file path (--itmo-path/--tmo-path): use the copy beside this file
+    _spec = importlib.util.spec_from_file_location(
+        "operator_common", os.path.join(os.path.dirname(os.path.abspath(__file__)), "operator_common.py"))
+    sys.modules["operator_common"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["operator_common"])
+from operator_common import USE_NUMBA as _USE_NUMBA, mix3 as _mix3, njit, prange, tiles as _tiles
+
+# PQ constants (SMPTE ST 2084)
+_L_MAX_PQ = 10000.0
+_M_PQ = 78.8438
+_N_PQ = 0.1593
+_c1_PQ = 0.8359
+_c2_PQ = 18.8516
+_c3_PQ = 18.6875
+
 def _histogram(x: np.ndarray, centers: np.ndarray) -> np.ndarray:
     """
     Computes image histogram using bin centers (not edges).
@@ -21,11 +44,196 @@ def _histogram(x: np.ndarray, centers: np.ndarray) -> np.ndarray:
     return counts.astype(np.float64)
 
 
+def _histogram_uniform(x: np.ndarray, c_first: float, c_last: float, num_bins: int) -> np.ndarray:
+    """
+    Same counts as _histogram(x, np.linspace(c_first, c_last, num_bins)), for evenly spaced
+    centers: each sample's bin is computed in closed form and counted with np.bincount
+    (no per-element search). As there, samples outside the outer edges are not counted.
+    """
+    x = np.asarray(x).ravel()
+    step = (c_last - c_first) / (num_bins - 1) if num_bins > 1 else 1.0
+    # outer edges in float64, so the cut matches np.histogram's for float32 samples too
+    lo = np.float64(c_first - step / 2.0)
+    hi = np.float64(c_last + step / 2.0)
+    inside = (x >= lo) & (x <= hi)
+    if not inside.all():  # e.g. 10-bit codes above 1020 map past the last edge
+        x = x[inside]
+    if num_bins == 1:
+        return np.array([x.size], dtype=np.float64)
+    # bin index in float64: in float32 samples next to an interior edge can round across it
+    idx = (x - np.float64(c_first)) * (1.0 / step) + 0.5
+    np.minimum(idx, num_bins - 1, out=idx)  # the last edge is inclusive
+    return np.bincount(idx.astype(np.intp), minlength=num_bins).astype(np.float64)
+
+
+@lru_cache(maxsize=None)
+def _gamma_lut(input_bit_depth: int, dtype: np.dtype) -> np.ndarray:
+    """
+    Code value -> linear light ((code / 2^(bitdepth-8)) / 255)^2.2 for every code of the given
+    bit depth, so integer frames take one table gather instead of a per-pixel pow.
+    """
+    codes = np.arange(2 ** input_bit_depth, dtype=np.float64)
+    lut = np.power((codes / (2.0 ** (input_bit_depth - 8))) / 255.0, 2.2, dtype=np.float64).astype(dtype)
+    lut.flags.writeable = False
+    return lut
+
+
+# ---------- Numba kernels (one fused pass per stage, used when numba runs with SVML) ----------
+@njit(inline="always", fastmath=True)
+def _pq(L):
+    t = math.pow(max(L / _L_MAX_PQ, 0.0), _N_PQ)
+    return math.pow((_c2_PQ * t + _c1_PQ) / (_c3_PQ * t + 1.0), _M_PQ)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _luma_pq_kernel(light, disp_Min, disp_Max, l_disp_PQ):
+    """PQ of the BT.709 luma in display light, per pixel."""
+    H, W = l_disp_PQ.shape
+    for i in prange(H):
+        for j in range(W):
+            y = 0.2126 * light[i, j, 0] + 0.7152 * light[i, j, 1] + 0.0722 * light[i, j, 2]
+            l_disp_PQ[i, j] = _pq(y * (disp_Max - disp_Min) + disp_Min)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _expand_kernel(light, l_disp_PQ, disp_Min, disp_Max, t1, t2, s1, s2, s3, a1, a2, a3,
+                   ymin, ymax, hdr_min, hdr_max, out):
+    """
+    Per pixel: R/G/B to PQ, piecewise expansion of the luma PQ, ratio scaling,
+    clamp, BT.709 -> BT.2020 and final clamp, written straight into out.
+    """
+    H, W = l_disp_PQ.shape
+    for i in prange(H):
+        for j in range(W):
+            l = l_disp_PQ[i, j]
+            if l < t1:
+                lh = s1 * l + a1
+            elif l < t2:
+                lh = s2 * l + a2
+            else:
+                lh = s3 * l + a3
+            lh = min(max(lh, ymin), ymax)
+            ratio = lh / l
+
+            r = min(max(ratio * _pq(light[i, j, 0] * (disp_Max - disp_Min) + disp_Min), hdr_min), hdr_max)
+            g = min(max(ratio * _pq(light[i, j, 1] * (disp_Max - disp_Min) + disp_Min), hdr_min), hdr_max)
+            b = min(max(ratio * _pq(light[i, j, 2] * (disp_Max - disp_Min) + disp_Min), hdr_min), hdr_max)
+
+            out[i, j, 0] = min(max(0.6274039 * r + 0.32928304 * g + 0.04331307 * b, 0.0), 1.0)
+            out[i, j, 1] = min(max(0.06909729 * r + 0.9195040 * g + 0.01136232 * b, 0.0), 1.0)
+            out[i, j, 2] = min(max(0.01639144 * r + 0.08801331 * g + 0.89559525 * b, 0.0), 1.0)
+
+
+# ---------- NumPy path (default): per-tile stages ----------
+def _to_pq(L, out=None):
+    """Forward PQ (OETF), in the dtype of L; computed in place in out (may be L itself)."""
+    t = np.divide(L, _L_MAX_PQ, out=out)
+    np.maximum(t, 0.0, out=t)
+    np.power(t, _N_PQ, out=t)  # (L/Lmax)^n
+    den = np.multiply(t, _c3_PQ)
+    den += 1.0
+    t *= _c2_PQ
+    t += _c1_PQ
+    t /= den
+    return np.power(t, _M_PQ, out=t)
+
+
+@lru_cache(maxsize=None)
+def _pq_lut(input_bit_depth: int, dtype: np.dtype, disp_Min: float, disp_Max: float) -> np.ndarray:
+    """Code value -> PQ of its display light: _gamma_lut followed by the stage-1 affine and _to_pq."""
+    lut = _gamma_lut(input_bit_depth, dtype) * (disp_Max - disp_Min)
+    lut += disp_Min
+    lut = _to_pq(lut, out=lut)
+    lut.flags.writeable = False
+    return lut
+
+
+_M709_TO_2020 = ((0.6274039, 0.32928304, 0.04331307),
+                 (0.06909729, 0.9195040, 0.01136232),
+                 (0.01639144, 0.08801331, 0.89559525))
+
+
+def _sdr_to_pq_tile(img_light, disp_Min, disp_Max, sdr_PQ):
+    """
+    R/G/B and luma of one tile of linear SDR light -> display light -> PQ, into the view
+    sdr_PQ (planar 4×h×w: R, G, B, Y, so every pass reads unit-stride planes).
+    """
+    # Split channels: one gather from the interleaved input into contiguous planes
+    np.copyto(sdr_PQ[:3], np.moveaxis(img_light, -1, 0))
+    red_SDR, green_SDR, blue_SDR, y_SDR = sdr_PQ
+
+    # BT.709 luma
+    tmp = np.empty_like(y_SDR)
+    np.multiply(red_SDR, 0.2126, out=y_SDR)
+    y_SDR += np.multiply(green_SDR, 0.7152, out=tmp)
+    y_SDR += np.multiply(blue_SDR, 0.0722, out=tmp)
+
+    # Map to display light range and PQ: one pass over all four planes
+    sdr_PQ *= disp_Max - disp_Min
+    sdr_PQ += disp_Min
+    _to_pq(sdr_PQ, out=sdr_PQ)
+
+
+def _codes_to_pq_tile(codes, light_lut, pq_lut, disp_Min, disp_Max, sdr_PQ):
+    """
+    _sdr_to_pq_tile for one tile of integer code values: R/G/B PQ come straight from pq_lut,
+    and only the luma, which mixes linear light, still needs the affine and _to_pq.
+    """
+    planes = np.moveaxis(codes, -1, 0)
+    np.take(pq_lut, planes, out=sdr_PQ[:3], mode="clip")  # codes are already in range
+
+    # BT.709 luma of the linear light
+    y_SDR = sdr_PQ[3]
+    tmp = np.empty_like(y_SDR)
+    np.take(light_lut, planes[0], out=y_SDR, mode="clip")
+    y_SDR *= 0.2126
+    np.take(light_lut, planes[1], out=tmp, mode="clip")
+    tmp *= 0.7152
+    y_SDR += tmp
+    np.take(light_lut, planes[2], out=tmp, mode="clip")
+    tmp *= 0.0722
+    y_SDR += tmp
+
+    y_SDR *= disp_Max - disp_Min
+    y_SDR += disp_Min
+    _to_pq(y_SDR, out=y_SDR)
+
+
+def _expand_tile(l_disp_PQ, rgb_SDR_PQ, curve, ymin, ymax, hDR_Min_PQ, hDR_Max_PQ, imgOut):
+    """Piecewise expansion, ratio scaling and BT.709 -> BT.2020 for one tile, into imgOut."""
+    x1, x2, s1, s2, s3, a1, a2, a3 = curve
+    dtype = l_disp_PQ.dtype
+
+    # Apply piecewise expansion in one multiply-add: pick each pixel's segment
+    # (0: l < x1, 1: l < x2, 2: otherwise -- same precedence as an if/elif chain)
+    seg = (l_disp_PQ >= x1).astype(np.uint8)
+    seg += seg & (l_disp_PQ >= x2)
+    lhdr_PQ = np.take(np.array([s1, s2, s3], dtype=dtype), seg)
+    lhdr_PQ *= l_disp_PQ
+    lhdr_PQ += np.take(np.array([a1, a2, a3], dtype=dtype), seg)
+
+    # Clamp to HDR PQ range
+    np.clip(lhdr_PQ, ymin, ymax, out=lhdr_PQ)
+
+    # Ratio in PQ
+    l_ratio_PQ = np.divide(lhdr_PQ, l_disp_PQ, out=lhdr_PQ)
+
+    # Scale R, g, b in PQ domain and clamp to [hDR_Min_PQ, hDR_Max_PQ]
+    rgb_HDR_PQ = np.multiply(rgb_SDR_PQ, l_ratio_PQ)
+    np.clip(rgb_HDR_PQ, hDR_Min_PQ, hDR_Max_PQ, out=rgb_HDR_PQ)
+
+    # Gamut conversion: BT.709 -> BT.2020 in normalized domain, then clamp to [0,1]
+    _mix3(_M709_TO_2020, rgb_HDR_PQ, imgOut, l_ratio_PQ)
+    np.clip(imgOut, 0.0, 1.0, out=imgOut)
+
+
 def proposed_itmo(
     input_frame: np.ndarray,
     input_bit_depth: int = 8,
     wB: float = 0.5,
     wC: float = 0.5,
+    dtype: np.dtype = np.float32,
+    out: np.ndarray | None = None,
 ) -> np.ndarray:
     """
     This is a Python implementation of the simplified version of the algorithm presented in my journal paper: 
@@ -37,21 +245,22 @@ def proposed_itmo(
       input_frame: H×W×3 array with integer code values (e.g., uint8/uint16) or float.
       input_bit_depth: 8 or 10. Determines quantization normalization.
       wB, wC: brightness/contrast weights.
+      dtype: floating type of the per-pixel math and of the output (float32 by default;
+             pass np.float64 for a double-precision reference).
+      out: optional H×W×3 array of the given dtype to write the result into (e.g. a
+           np.memmap backed by a .npy file); returned as imgOut.
 
     Output
-      imgOut: H×W×3 float64 HDR image in BT.2020 primaries, *light domain*, in nits
+      imgOut: H×W×3 HDR image of the given dtype in BT.2020 primaries, *light domain*, in nits
               clamped to [0.01, 1000].
     """
     # --- Input & types ---
-    img_double = np.asarray(input_frame, dtype=np.float64)
-
-    # PQ constants (SMPTE ST 2084)
-    l_max_PQ = 10000.0
-    m_PQ = 78.8438
-    n_PQ = 0.1593
-    c1_PQ = 0.8359
-    c2_PQ = 18.8516
-    c3_PQ = 18.6875
+    # R, G, B only: an alpha (or any extra) channel is ignored, as the per-channel baseline did
+    input_frame = np.asarray(input_frame)[..., :3]
+    dtype = np.dtype(dtype)
+    out_shape = input_frame.shape[:-1] + (3,)
+    if out is not None and (out.shape != out_shape or out.dtype != dtype):
+        raise ValueError(f"out must be {out_shape} {dtype}, got {out.shape} {out.dtype}")
 
     # Representation min/max
     maxValueY = ((256.0 * 1.0) * (2.0 ** (input_bit_depth - 8))) - 1.0
@@ -63,41 +272,44 @@ def proposed_itmo(
     hDR_Min_PQ = 0.0215
     hDR_Max_PQ = 0.7518
 
-    # Clamp input to the nominal code range (same scalar limits for all channels)
-    img_double = np.clip(img_double, minValueY, maxValueY)
-
-    # Full scaling and quantization (bit-depth downshift to 8-bit, then /255)
-    scale = 2.0 ** (input_bit_depth - 8)
-    img_normalized = (img_double / scale) / 255.0
-
-    # Simple gamma to linear light (approximate inverse of 2.2 OETF)
-    img_light = np.power(img_normalized, 2.2, dtype=np.float64)
-
-    # Split channels
-    red_SDR = img_light[..., 0]
-    green_SDR = img_light[..., 1]
-    blue_SDR = img_light[..., 2]
-
-    # BT.709 luma
-    y_SDR = 0.2126 * red_SDR + 0.7152 * green_SDR + 0.0722 * blue_SDR
-
-    # Map to display light range
-    red_SDR_Light = red_SDR * (disp_Max - disp_Min) + disp_Min
-    green_SDR_Light = green_SDR * (disp_Max - disp_Min) + disp_Min
-    blue_SDR_Light = blue_SDR * (disp_Max - disp_Min) + disp_Min
-    L_disp = y_SDR * (disp_Max - disp_Min) + disp_Min
-
-    # Forward PQ (OETF)
-    def _to_pq(L):
-        t = np.power(np.maximum(L / l_max_PQ, 0.0), n_PQ, dtype=np.float64)  # (L/Lmax)^n
-        num = c2_PQ * t + c1_PQ
-        den = c3_PQ * t + 1.0
-        return np.power(num / den, m_PQ, dtype=np.float64)
-
-    l_disp_PQ = _to_pq(L_disp)
-    red_SDR_PQ = _to_pq(red_SDR_Light)
-    green_SDR_PQ = _to_pq(green_SDR_Light)
-    blue_SDR_PQ = _to_pq(blue_SDR_Light)
+    integer = np.issubdtype(input_frame.dtype, np.integer)
+    if integer:
+        # Integer code values: clamp, then gamma to linear light through a table lookup
+        # (uint8 codes are always in range, so they index the table directly)
+        codes = input_frame
+        if codes.dtype != np.uint8:
+            codes = np.clip(codes, int(minValueY), int(maxValueY))
+        light_lut = _gamma_lut(input_bit_depth, dtype)
+    else:
+        # Clamp input to the nominal code range (same scalar limits for all channels);
+        # astype() gives a private copy, so every step below runs in place on it
+        img_light = input_frame.astype(dtype)
+        np.clip(img_light, minValueY, maxValueY, out=img_light)
+
+        # Full scaling and quantization (bit-depth downshift to 8-bit, then /255)
+        scale = 2.0 ** (input_bit_depth - 8)
+        img_light /= scale
+        img_light /= 255.0
+
+        # Simple gamma to linear light (approximate inverse of 2.2 OETF)
+        np.power(img_light, 2.2, out=img_light)
+
+    if _USE_NUMBA:
+        if integer:
+            img_light = light_lut[codes]
+        l_disp_PQ = np.empty(img_light.shape[:-1], dtype=dtype)
+        _luma_pq_kernel(img_light, disp_Min, disp_Max, l_disp_PQ)
+    else:
+        # Stage 1 tile by tile; the histogram below needs the whole luma plane
+        sdr_PQ = np.empty((4,) + input_frame.shape[:-1], dtype=dtype)  # planar R, G, B, Y
+        rgb_SDR_PQ, l_disp_PQ = sdr_PQ[:3], sdr_PQ[3]
+        if integer:
+            pq_lut = _pq_lut(input_bit_depth, dtype, disp_Min, disp_Max)
+            for t in _tiles(l_disp_PQ.shape):
+                _codes_to_pq_tile(codes[t], light_lut, pq_lut, disp_Min, disp_Max, sdr_PQ[(slice(None),) + t])
+        else:
+            for t in _tiles(l_disp_PQ.shape):
+                _sdr_to_pq_tile(img_light[t], disp_Min, disp_Max, sdr_PQ[(slice(None),) + t])
 
     # PQ-domain ranges
     xmin = 0.0623  # PQ(disp_Min)
@@ -105,11 +317,10 @@ def proposed_itmo(
     ymin = 0.0215  # PQ(HDR_Min)
     ymax = 0.7518  # PQ(HDR_Max)
 
-    # Histogram of PQ-ed luminance using bin *centers* (2^bitdepth bins)
+    # Histogram of PQ-ed luminance using bin *centers* (2^bitdepth bins, evenly spaced)
     num_bins = int(2 ** input_bit_depth)
-    centers = np.linspace(xmin, xmax, num_bins, dtype=np.float64)
     larray_disp_PQ = l_disp_PQ.reshape(-1)
-    n_light = _histogram(larray_disp_PQ, centers)
+    n_light = _histogram_uniform(larray_disp_PQ, xmin, xmax, num_bins)
 
     # Segment thresholds & parameters
     x1 = 0.1233
@@ -145,48 +356,57 @@ def proposed_itmo(
     p_2 = (1.0 - p2) / 2.0
     p_3 = (1.0 - p3) / 2.0
 
-    # Brightness/contrast maximization constants
-    a1 = p_1 * 0.3073
-    a2 = p_2 * 11.5866
-    a3 = p_3 * 13.2019
-    b1 = p_1 * 3.2207
-    b2 = p_2 * 40.7965
-    b3 = p_3 * 28.9940
-
-    fc = 0.0809
-    fb = 13.6971
-    w1 = wC / fc
-    w2 = wB / fb
-
-    # Solve for piecewise-linear slopes in PQ domain
-    denom1 = (w1 * delta1 * delta1 * p_1 + w2 * a1 - 2.0 * w2 * xmin * b1 + w2 * n1 * xmin * xmin + w2 * n2 * delta1 * delta1)
-    denom2 = (w1 * delta2 * delta2 * p_2 + w2 * a2 - 2.0 * w2 * x1 * b2 + w2 * n2 * x1 * x1)
-    denom3 = (w1 * delta3 * delta3 * p_3 + w2 * a3 - 2.0 * w2 * xmax * b3 + w2 * n3 * xmax * xmax)
-
-    a = (w2 * n2 * delta1 * x1 - w2 * delta1 * b2) / denom1
-    b = (w2 * n1 * (ymin - xmin) * xmin - w2 * (ymin - xmin) * b1 - w2 * n2 * (ymin - xmin) * delta1) / denom1
-    c = (-delta1) / (2.0 * denom1)
-
-    d = (w2 * n2 * delta1 * x1 - w2 * delta1 * b2) / denom2
-    e = (w2 * n2 * (ymin - xmin) * x1 - w2 * (ymin - xmin) * b2) / denom2
-    f = (-delta2) / (2.0 * denom2)
-
-    g = (w2 * n3 * (ymax - xmax) * xmax - w2 * (ymax - xmax) * b3) / denom3
-    h = (-delta3) / (2.0 * denom3)
-
-    # Lambda and region gains
-    ad = 1.0 - a * d
-    x1 = ((a * e + b) / ad)  # + ((a * f + c) / ad) * lambda  (filled after lambda)
-    x2 = ((b * d + e) / ad)  # + ((c * d + f) / ad) * lambda
-    c1lam = (a * f + c) / ad
-    c2lam = (c * d + f) / ad
-    # lambda:
-    lam_num = r - (x1 * delta1 + x2 * delta2 + g * delta3)
-    lam_den = (c1lam * delta1 + c2lam * delta2 + h * delta3)
-    lam = lam_num / lam_den
-    x1 = x1 + c1lam * lam
-    x2 = x2 + c2lam * lam
-    X3 = g + h * lam
+    if wB == 0.0 and wC != 0.0:
+        # Contrast term only: every brightness term drops out, the system decouples and the
+        # slopes have a closed form, r / (delta_i * p_i * sum_j 1/p_j), independent of wC
+        # (the region probabilities still come from the histogram above)
+        inv_p = 1.0 / p_1 + 1.0 / p_2 + 1.0 / p_3
+        x1 = r / (delta1 * p_1 * inv_p)
+        x2 = r / (delta2 * p_2 * inv_p)
+        X3 = r / (delta3 * p_3 * inv_p)
+    else:
+        # Brightness/contrast maximization constants
+        a1 = p_1 * 0.3073
+        a2 = p_2 * 11.5866
+        a3 = p_3 * 13.2019
+        b1 = p_1 * 3.2207
+        b2 = p_2 * 40.7965
+        b3 = p_3 * 28.9940
+
+        fc = 0.0809
+        fb = 13.6971
+        w1 = wC / fc
+        w2 = wB / fb
+
+        # Solve for piecewise-linear slopes in PQ domain
+        denom1 = (w1 * delta1 * delta1 * p_1 + w2 * a1 - 2.0 * w2 * xmin * b1 + w2 * n1 * xmin * xmin + w2 * n2 * delta1 * delta1)
+        denom2 = (w1 * delta2 * delta2 * p_2 + w2 * a2 - 2.0 * w2 * x1 * b2 + w2 * n2 * x1 * x1)
+        denom3 = (w1 * delta3 * delta3 * p_3 + w2 * a3 - 2.0 * w2 * xmax * b3 + w2 * n3 * xmax * xmax)
+
+        a = (w2 * n2 * delta1 * x1 - w2 * delta1 * b2) / denom1
+        b = (w2 * n1 * (ymin - xmin) * xmin - w2 * (ymin - xmin) * b1 - w2 * n2 * (ymin - xmin) * delta1) / denom1
+        c = (-delta1) / (2.0 * denom1)
+
+        d = (w2 * n2 * delta1 * x1 - w2 * delta1 * b2) / denom2
+        e = (w2 * n2 * (ymin - xmin) * x1 - w2 * (ymin - xmin) * b2) / denom2
+        f = (-delta2) / (2.0 * denom2)
+
+        g = (w2 * n3 * (ymax - xmax) * xmax - w2 * (ymax - xmax) * b3) / denom3
+        h = (-delta3) / (2.0 * denom3)
+
+        # Lambda and region gains
+        ad = 1.0 - a * d
+        x1 = ((a * e + b) / ad)  # + ((a * f + c) / ad) * lambda  (filled after lambda)
+        x2 = ((b * d + e) / ad)  # + ((c * d + f) / ad) * lambda
+        c1lam = (a * f + c) / ad
+        c2lam = (c * d + f) / ad
+        # lambda:
+        lam_num = r - (x1 * delta1 + x2 * delta2 + g * delta3)
+        lam_den = (c1lam * delta1 + c2lam * delta2 + h * delta3)
+        lam = lam_num / lam_den
+        x1 = x1 + c1lam * lam
+        x2 = x2 + c2lam * lam
+        X3 = g + h * lam
 
     # Expansion function (piecewise linear in PQ)
     s1 = x1 + 1.0
@@ -196,39 +416,14 @@ def proposed_itmo(
     a2 = (s1 - s2) * x1 + a1
     a3 = ymax - s3 * xmax
 
-    # Apply piecewise expansion
-    lhdr_PQ = s3 * l_disp_PQ + a3
-    mask2 = l_disp_PQ < x2
-    lhdr_PQ = np.where(mask2, s2 * l_disp_PQ + a2, lhdr_PQ)
-    mask1 = l_disp_PQ < x1
-    lhdr_PQ = np.where(mask1, s1 * l_disp_PQ + a1, lhdr_PQ)
-
-    # Clamp to HDR PQ range
-    lhdr_PQ = np.clip(lhdr_PQ, ymin, ymax)
-
-    # Ratio in PQ
-    l_ratio_PQ = lhdr_PQ / l_disp_PQ
-
-    # Scale R, g, b in PQ domain
-    red_HDR_PQ = l_ratio_PQ * red_SDR_PQ
-    blue_HDR_PQ = l_ratio_PQ * blue_SDR_PQ
-    green_HDR_PQ = l_ratio_PQ * green_SDR_PQ
-
-    # Clamp to [hDR_Min_PQ, hDR_Max_PQ]
-    red_HDR_PQ = np.clip(red_HDR_PQ, hDR_Min_PQ, hDR_Max_PQ)
-    green_HDR_PQ = np.clip(green_HDR_PQ, hDR_Min_PQ, hDR_Max_PQ)
-    blue_HDR_PQ = np.clip(blue_HDR_PQ, hDR_Min_PQ, hDR_Max_PQ)    
-
-    # Gamut conversion: BT.709 -> BT.2020 in normalized domain
-    # Then clamp to [0,1] and scale back to light domain.
-    imgOut_norm2020_r = 0.6274039 * red_HDR_PQ + 0.32928304 * green_HDR_PQ + 0.04331307 * blue_HDR_PQ
-    imgOut_norm2020_g = 0.06909729 * red_HDR_PQ + 0.9195040 * green_HDR_PQ + 0.01136232 * blue_HDR_PQ
-    imgOut_norm2020_b = 0.01639144 * red_HDR_PQ + 0.08801331 * green_HDR_PQ + 0.89559525 * blue_HDR_PQ
-
-    imgOut_norm2020_r = np.clip(imgOut_norm2020_r, 0.0, 1.0)
-    imgOut_norm2020_g = np.clip(imgOut_norm2020_g, 0.0, 1.0)
-    imgOut_norm2020_b = np.clip(imgOut_norm2020_b, 0.0, 1.0)
-
-    # Stack and scale to nits
-    imgOut = np.stack([imgOut_norm2020_r, imgOut_norm2020_g, imgOut_norm2020_b], axis=-1)
-    return imgOut.astype(np.float64)
+    imgOut = np.empty(out_shape, dtype=dtype) if out is None else out
+    if _USE_NUMBA:
+        _expand_kernel(img_light, l_disp_PQ, disp_Min, disp_Max, x1, x2, s1, s2, s3, a1, a2, a3,
+                       ymin, ymax, hDR_Min_PQ, hDR_Max_PQ, imgOut)
+        return imgOut
+
+    # Stage 2 tile by tile, written straight into the output
+    curve = (x1, x2, s1, s2, s3, a1, a2, a3)
+    for t in _tiles(l_disp_PQ.shape):
+        _expand_tile(l_disp_PQ[t], rgb_SDR_PQ[(slice(None),) + t], curve, ymin, ymax, hDR_Min_PQ, hDR_Max_PQ, imgOut[t])
+    return imgOut
@@ -1,7 +1,21 @@
 
+import importlib.util
+import math
+import os
+import sys
 import numpy as np
+from functools import lru_cache
 from typing import Literal
 
+try:
+    import operator_common  # noqa: F401
+except ModuleNotFoundError:  # loaded by file path (--itmo-path/--tmo-path): use the copy beside this file
+    _spec = importlib.util.spec_from_file_location(
+        "operator_common", os.path.join(os.path.dirname(os.path.abspath(__file__)), "operator_common.py"))
+    sys.modules["operator_common"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["operator_common"])
+from operator_common import USE_NUMBA as _USE_NUMBA, mix3 as _mix3, njit, prange, tiles as _tiles
+
 _L_MAX_PQ = 10000.0
 _M_PQ = 78.8438
 _N_PQ = 0.1593
@@ -9,12 +23,149 @@ _c1_PQ = 0.8359
 _c2_PQ = 18.8516
 _c3_PQ = 18.6875
 
-def _from_pq(P: np.ndarray) -> np.ndarray:
-    P = np.asarray(P, dtype=np.float64)
-    P_root = np.power(np.maximum(P, 0.0), 1.0 / _M_PQ, dtype=np.float64)
-    num = np.maximum(P_root - _c1_PQ, 0.0)
-    den = (_c2_PQ - _c3_PQ * P_root)
-    return _L_MAX_PQ * np.power(np.maximum(num / den, 0.0), 1.0 / _N_PQ, dtype=np.float64)
+def _from_pq(P: np.ndarray, out=None) -> np.ndarray:
+    P = np.asarray(P)  # keeps the caller's float32/float64; out may be P itself
+    P_root = np.maximum(P, 0.0, out=out)
+    np.power(P_root, 1.0 / _M_PQ, out=P_root)
+    den = np.multiply(P_root, _c3_PQ)
+    np.subtract(_c2_PQ, den, out=den)
+    P_root -= _c1_PQ
+    np.maximum(P_root, 0.0, out=P_root)  # num
+    P_root /= den
+    np.maximum(P_root, 0.0, out=P_root)
+    np.power(P_root, 1.0 / _N_PQ, out=P_root)
+    P_root *= _L_MAX_PQ
+    return P_root
+
+# Mapping curves in the PQ domain
+_PWL_X = (0.1310, 0.4597)                # segment breakpoints
+_PWL_S = (0.5570, 0.8339, 0.3787)        # slopes
+_PWL_A = (0.0503, 0.0141, 0.2233)        # offsets
+_GAMMA_C = (0.6012, 0.5902)              # c1 * y^c2
+
+_GAMMA_LUT_SIZE = 65536
+
+@lru_cache(maxsize=None)
+def _gamma_lut(gammaSDR: float, dtype: np.dtype) -> np.ndarray:
+    # x^(1/gamma) indexed by sqrt(x) on a 16-bit grid: x^(1/gamma) is infinitely steep at 0, so
+    # an even grid in x rounds the dark end badly; in sqrt(x) the curve is (u^2)^(1/gamma),
+    # nearly linear, and the table error stays well below 1/255 down to black
+    u = np.arange(_GAMMA_LUT_SIZE, dtype=np.float64) / (_GAMMA_LUT_SIZE - 1)
+    lut = np.power(u, 2.0 / gammaSDR, dtype=np.float64).astype(dtype)
+    lut.flags.writeable = False
+    return lut
+
+@njit(inline="always", fastmath=True)
+def _from_pq_scalar(P):
+    P_root = math.pow(max(P, 0.0), 1.0 / _M_PQ)
+    num = max(P_root - _c1_PQ, 0.0)
+    den = _c2_PQ - _c3_PQ * P_root
+    return _L_MAX_PQ * math.pow(max(num / den, 0.0), 1.0 / _N_PQ)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _tmo_kernel(img, piecewise, hDRmin_PQ, hDRmax_PQ, sDRmin_PQ, sDRmax_PQ, sDRmin, sDRmax,
+                alpha, gamma_lut, out):
+    """
+    Fused per-pixel HDR -> SDR: PQ clamp, BT.2020 luma, mapping curve, colour ratio,
+    inverse PQ, BT.2020 -> BT.709 and the final gamma (table lookup), written into out.
+    """
+    H, W = img.shape[0], img.shape[1]
+    n = gamma_lut.shape[0] - 1
+    for i in prange(H):
+        for j in range(W):
+            r = min(max(img[i, j, 0], hDRmin_PQ), hDRmax_PQ)
+            g = min(max(img[i, j, 1], hDRmin_PQ), hDRmax_PQ)
+            b = min(max(img[i, j, 2], hDRmin_PQ), hDRmax_PQ)
+            y = 0.2627 * r + 0.6779 * g + 0.0593 * b
+
+            if piecewise:
+                if y < _PWL_X[0]:
+                    ys = _PWL_S[0] * y + _PWL_A[0]
+                elif y < _PWL_X[1]:
+                    ys = _PWL_S[1] * y + _PWL_A[1]
+                else:
+                    ys = _PWL_S[2] * y + _PWL_A[2]
+            else:
+                ys = _GAMMA_C[0] * math.pow(y, _GAMMA_C[1])
+
+            scale = alpha * (ys / y) if y != 0 else 0.0
+            r = min(max(_from_pq_scalar(min(max(scale * r, sDRmin_PQ), sDRmax_PQ)), sDRmin), sDRmax)
+            g = min(max(_from_pq_scalar(min(max(scale * g, sDRmin_PQ), sDRmax_PQ)), sDRmin), sDRmax)
+            b = min(max(_from_pq_scalar(min(max(scale * b, sDRmin_PQ), sDRmax_PQ)), sDRmin), sDRmax)
+            r = (r - sDRmin) / (sDRmax - sDRmin)
+            g = (g - sDRmin) / (sDRmax - sDRmin)
+            b = (b - sDRmin) / (sDRmax - sDRmin)
+
+            r709 = min(max( 1.6605 * r - 0.5876 * g - 0.0728 * b, 0.0), 1.0)
+            g709 = min(max(-0.1246 * r + 1.1329 * g - 0.0083 * b, 0.0), 1.0)
+            b709 = min(max(-0.0182 * r - 0.1006 * g + 1.1187 * b, 0.0), 1.0)
+            out[i, j, 0] = gamma_lut[int(math.sqrt(r709) * n + 0.5)]
+            out[i, j, 1] = gamma_lut[int(math.sqrt(g709) * n + 0.5)]
+            out[i, j, 2] = gamma_lut[int(math.sqrt(b709) * n + 0.5)]
+
+# ---------- NumPy path (default): per-tile chain ----------
+_M2020_TO_709 = (( 1.6605, -0.5876, -0.0728),
+                 (-0.1246,  1.1329, -0.0083),
+                 (-0.0182, -0.1006,  1.1187))
+
+def _tmo_tile(img, mappingCurve, hDRmin_PQ, hDRmax_PQ, sDRmin_PQ, sDRmax_PQ,
+              sDRmin, sDRmax, alpha, gamma_lut, imgOut_SDR):
+    """HDR -> SDR for one tile of img, written into imgOut_SDR (also used as scratch)."""
+    dtype = img.dtype
+    # one planar (3×h×w) working copy of the tile, so every later step runs in place
+    # on unit-stride R, G, B planes; only the final write goes back to interleaved
+    img_PQ = np.empty((3,) + img.shape[:-1], dtype=dtype)
+    np.clip(np.moveaxis(img, -1, 0), hDRmin_PQ, hDRmax_PQ, out=img_PQ)
+    red_HDR_PQ, green_HDR_PQ, blue_HDR_PQ = img_PQ
+
+    #Luminance channel for BT.2020 gamut
+    y_HDR_PQ = np.multiply(red_HDR_PQ, 0.2627)
+    tmp = np.empty_like(y_HDR_PQ)
+    y_HDR_PQ += np.multiply(green_HDR_PQ, 0.6779, out=tmp)
+    y_HDR_PQ += np.multiply(blue_HDR_PQ, 0.0593, out=tmp)
+
+    # Mapping curve
+    if mappingCurve == "PiecewiseLinear":
+        x1, x2 = _PWL_X
+        s1, s2, s3 = _PWL_S
+        a1, a2, a3 = _PWL_A
+
+        # one multiply-add with the per-pixel segment (0: y < x1, 1: y < x2, 2: otherwise)
+        seg = (y_HDR_PQ >= x1).astype(np.uint8)
+        seg += seg & (y_HDR_PQ >= x2)
+        y_SDR_PQ = np.take(np.array([s1, s2, s3], dtype=dtype), seg)
+        y_SDR_PQ *= y_HDR_PQ
+        y_SDR_PQ += np.take(np.array([a1, a2, a3], dtype=dtype), seg)
+    else:
+        c1, c2 = _GAMMA_C
+        y_SDR_PQ = np.power(y_HDR_PQ, c2, out=tmp)
+        y_SDR_PQ *= c1
+
+    # Color adjustment
+    if hDRmin_PQ > 0:
+        # after the clip y >= 0.9999 * hDRmin_PQ (luma weights), so a plain divide is safe
+        ratio = np.divide(y_SDR_PQ, y_HDR_PQ, out=y_SDR_PQ)
+    else:
+        ratio = np.divide(y_SDR_PQ, y_HDR_PQ, out=np.zeros_like(y_SDR_PQ), where=(y_HDR_PQ != 0))
+    ratio *= alpha
+    img_PQ *= ratio
+    np.clip(img_PQ, sDRmin_PQ, sDRmax_PQ, out=img_PQ)
+
+    img_SDR = _from_pq(img_PQ, out=img_PQ)
+    np.clip(img_SDR, sDRmin, sDRmax, out=img_SDR)
+
+    img_SDR -= sDRmin
+    img_SDR /= sDRmax - sDRmin
+
+    # BT.2020 to BT.709 conversion
+    _mix3(_M2020_TO_709, img_SDR, imgOut_SDR, ratio)
+    np.clip(imgOut_SDR, 0.0, 1.0, out=imgOut_SDR)
+
+    # Gamma encoding via table lookup on the 16-bit quantized sqrt of the [0, 1] signal
+    np.sqrt(imgOut_SDR, out=imgOut_SDR)
+    imgOut_SDR *= _GAMMA_LUT_SIZE - 1
+    idx = np.rint(imgOut_SDR, out=imgOut_SDR).astype(np.uint16)
+    np.take(gamma_lut, idx, out=imgOut_SDR)
 
 def proposed_tmo(
     imgIn_HDR: np.ndarray,
@@ -27,13 +178,14 @@ def proposed_tmo(
     sDRmax: float = 100.0,
     gammaSDR: float = 2.2,
     alpha: float = 1.0,
+    dtype: np.dtype = np.float32,
 ) -> np.ndarray:
 
     """
     This is a Python implementation of my proposed HDR --> SDR conversion algorithm.
 
     Inputs
-        imgIn_HDR: Input HDR frame 
+        imgIn_HDR: Input HDR frame (H×W×3), or a stack of frames (B×H×W×3)
         mappingCurve: Type of the mapping curve for HDR to SDR conversion,
         hDRmin_PQ: PQ equivalent of 0.01 nits
         hDRmax_PQ: PQ equivalent of 1000 nits
@@ -43,69 +195,26 @@ def proposed_tmo(
         sDRmax: Maximum brightness value of the input SDR frame (100 nits)
         gammaSDR: Gamma value
         alpha: Saturation factor in color correction (Higher mean more saturated colors)
+        dtype: Floating type of the computation and output (float32 by default)
 
     Output
         imgOut_SDR: Generated SDR frame
     """
     
-    img = np.asarray(imgIn_HDR, dtype=np.float64)
-
-    imgIn_HDR_Normalized = img
-    imgIn_HDR_PQ = np.clip(imgIn_HDR_Normalized, hDRmin_PQ, hDRmax_PQ)
-
-    red_HDR_PQ   = imgIn_HDR_PQ[..., 0]
-    green_HDR_PQ = imgIn_HDR_PQ[..., 1]
-    blue_HDR_PQ  = imgIn_HDR_PQ[..., 2]
-
-    #Luminance channel for BT.2020 gamut
-    y_HDR_PQ = 0.2627 * red_HDR_PQ + 0.6779 * green_HDR_PQ + 0.0593 * blue_HDR_PQ
-
-    # Mapping curve
-    if mappingCurve == "PiecewiseLinear":
-        x1, x2 = 0.1310, 0.4597
-        s1, s2, s3 = 0.5570, 0.8339, 0.3787
-        a1, a2, a3 = 0.0503, 0.0141, 0.2233
-
-        y_SDR_PQ = s3 * y_HDR_PQ + a3
-        mask2 = y_HDR_PQ < x2
-        y_SDR_PQ = np.where(mask2, s2 * y_HDR_PQ + a2, y_SDR_PQ)
-        mask1 = y_HDR_PQ < x1
-        y_SDR_PQ = np.where(mask1, s1 * y_HDR_PQ + a1, y_SDR_PQ)
-    else:
-        c1, c2 = 0.6012, 0.5902
-        y_SDR_PQ = c1 * np.power(y_HDR_PQ, c2, dtype=np.float64)
-
-    # Color adjustment
-    ratio = np.divide(y_SDR_PQ, y_HDR_PQ, out=np.zeros_like(y_SDR_PQ), where=(y_HDR_PQ != 0))
-    scale = alpha * ratio
-    red_SDR_PQ   = scale * red_HDR_PQ
-    green_SDR_PQ = scale * green_HDR_PQ
-    blue_SDR_PQ  = scale * blue_HDR_PQ
-
-    red_SDR_PQ   = np.clip(red_SDR_PQ,   sDRmin_PQ, sDRmax_PQ)
-    green_SDR_PQ = np.clip(green_SDR_PQ, sDRmin_PQ, sDRmax_PQ)
-    blue_SDR_PQ  = np.clip(blue_SDR_PQ,  sDRmin_PQ, sDRmax_PQ)
-
-    red_SDR   = _from_pq(red_SDR_PQ)
-    green_SDR = _from_pq(green_SDR_PQ)
-    blue_SDR  = _from_pq(blue_SDR_PQ)
-
-    img_SDR = np.stack([red_SDR, green_SDR, blue_SDR], axis=-1)
-    img_SDR = np.clip(img_SDR, sDRmin, sDRmax)
-
-    img_SDR_Normalized = (img_SDR - sDRmin) / (sDRmax - sDRmin)
-
-    r2020 = img_SDR_Normalized[..., 0]
-    g2020 = img_SDR_Normalized[..., 1]
-    b2020 = img_SDR_Normalized[..., 2]
-
-    # BT.2020 to BT.709 conversion
-    red_SDR_709   =  1.6605 * r2020 - 0.5876 * g2020 - 0.0728 * b2020
-    green_SDR_709 = -0.1246 * r2020 + 1.1329 * g2020 - 0.0083 * b2020
-    blue_SDR_709  = -0.0182 * r2020 - 0.1006 * g2020 + 1.1187 * b2020
-
-    imgOut_709 = np.stack([red_SDR_709, green_SDR_709, blue_SDR_709], axis=-1)
-    imgOut_709 = np.clip(imgOut_709, 0.0, 1.0)
-
-    imgOut_SDR = np.power(imgOut_709, 1.0 / gammaSDR, dtype=np.float64)
-    return imgOut_SDR.astype(np.float64)
+    dtype = np.dtype(dtype)
+    # R, G, B only (an alpha channel is ignored); sliced before the cast so it is not converted
+    img = np.asarray(np.asarray(imgIn_HDR)[..., :3], dtype=dtype)
+
+    if _USE_NUMBA and img.ndim == 3:
+        imgOut_SDR = np.empty(img.shape[:-1] + (3,), dtype=dtype)
+        _tmo_kernel(img, mappingCurve == "PiecewiseLinear", hDRmin_PQ, hDRmax_PQ, sDRmin_PQ, sDRmax_PQ,
+                    sDRmin, sDRmax, alpha, _gamma_lut(float(gammaSDR), dtype), imgOut_SDR)
+        return imgOut_SDR
+
+    # NumPy path: the whole chain per tile, written straight into the output
+    imgOut_SDR = np.empty(img.shape[:-1] + (3,), dtype=dtype)
+    gamma_lut = _gamma_lut(float(gammaSDR), dtype)
+    for t in _tiles(img.shape[:-1]):
+        _tmo_tile(img[t], mappingCurve, hDRmin_PQ, hDRmax_PQ, sDRmin_PQ, sDRmax_PQ,
+                  sDRmin, sDRmax, alpha, gamma_lut, imgOut_SDR[t])
+    return imgOut_SDR
@@ -1,90 +1,421 @@
 import argparse
+import importlib
+import importlib.util
+import inspect
+import io
+import os
+import posixpath
+import queue
 import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+from functools import lru_cache
 from pathlib import Path
 import numpy as np
 
+try:
+    import numba
+    from numba import njit, prange
+    _HAVE_NUMBA = True
+except ImportError:  # optional: fall back to the NumPy path
+    _HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
 # ---------- IO helpers ----------
-def _read_image(path: str):
-    try:
-        import imageio.v3 as iio
-        return iio.imread(path)
-    except Exception:
-        from PIL import Image
-        return np.array(Image.open(path).convert("RGB"))
-
-def _write_image(path: str, array_uint8: np.ndarray):
-    outp = Path(path)
-    outp.parent.mkdir(parents=True, exist_ok=True)
-    try:
-        import imageio.v3 as iio
-        iio.imwrite(str(outp), array_uint8)
-    except Exception:
-        from PIL import Image
-        Image.fromarray(array_uint8).save(str(outp))
+# Backends are resolved once at import. A missing imageio is not cached by Python's import
+# system, so probing it per frame re-scanned sys.path on every read and write.
+# OpenCV is tried first (libpng/libjpeg-turbo without the Python wrapping; faster on both
+# decode and encode), then imageio, then PIL.
+try:
+    import cv2
+except ImportError:  # the other preprocess scripts need it, this one does not
+    cv2 = None
+try:
+    import imageio.v3 as iio
+except ImportError:  # PIL-only installs
+    iio = None
+try:
+    from PIL import Image
+except ImportError:  # imageio-only installs
+    Image = None
+
+def _swap_rb(img: np.ndarray) -> np.ndarray:
+    """BGR(A) <-> RGB(A); OpenCV's channel order vs the RGB frames ITMO/TMO work on."""
+    if img.ndim == 3 and img.shape[2] in (3, 4):
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB if img.shape[2] == 3 else cv2.COLOR_BGRA2RGBA)
+    return img
+
+def _cv2_params(encode_kwargs: dict) -> list:
+    """cv2.imwrite flags for the Pillow-style options of _encode_kwargs."""
+    params = []
+    if "compress_level" in encode_kwargs:
+        params += [cv2.IMWRITE_PNG_COMPRESSION, int(encode_kwargs["compress_level"])]
+    if "quality" in encode_kwargs:
+        params += [cv2.IMWRITE_JPEG_QUALITY, int(encode_kwargs["quality"])]
+    return params
+
+def _read_image(src):
+    """Decodes a frame from a path or a binary file object (e.g. io.BytesIO of a tar member)."""
+    if cv2 is not None:
+        if hasattr(src, "getbuffer"):
+            img = cv2.imdecode(np.frombuffer(src.getbuffer(), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        else:
+            img = cv2.imread(src, cv2.IMREAD_UNCHANGED)
+        if img is not None:
+            return _swap_rb(img)
+        if iio is None and Image is None:
+            raise OSError(f"cannot decode {src}")
+    if iio is not None:
+        try:
+            return iio.imread(src)
+        except Exception:
+            if Image is None:
+                raise
+            if hasattr(src, "seek"):
+                src.seek(0)
+    # PIL: when imageio is missing or could not decode the file
+    return np.array(Image.open(src).convert("RGB"))
+
+def _encode_kwargs(ext: str, png_compress: int = 1) -> dict:
+    """Pillow save options per output extension (imageio passes them through)."""
+    ext = ext.lower()
+    if ext == ".png":
+        return {"compress_level": png_compress}
+    if ext in (".jpg", ".jpeg"):
+        return {"quality": 90}
+    return {}
+
+def _write_image(path: str, array_uint8: np.ndarray, **encode_kwargs):
+    """Writes one frame; the parent directory must already exist (callers create it once)."""
+    if cv2 is not None:
+        try:
+            if cv2.imwrite(path, _swap_rb(array_uint8), _cv2_params(encode_kwargs)):
+                return
+        except cv2.error:  # no OpenCV encoder for this extension
+            pass
+        if iio is None and Image is None:
+            raise OSError(f"cannot write {path}")
+    if iio is not None:
+        try:
+            iio.imwrite(path, array_uint8, **encode_kwargs)
+            return
+        except Exception:
+            if Image is None:
+                raise
+    Image.fromarray(array_uint8).save(path, **encode_kwargs)
+
+def _encode_image(array_uint8: np.ndarray, ext: str, **encode_kwargs) -> bytes:
+    """Encodes a frame to the bytes of an `ext` file, for archive members."""
+    if cv2 is not None:
+        try:
+            ok, buf = cv2.imencode(ext, _swap_rb(array_uint8), _cv2_params(encode_kwargs))
+            if ok:
+                return buf.tobytes()
+        except cv2.error:
+            pass
+        if iio is None and Image is None:
+            raise OSError(f"cannot encode {ext}")
+    if iio is not None:
+        try:
+            return iio.imwrite("<bytes>", array_uint8, extension=ext, **encode_kwargs)
+        except Exception:
+            if Image is None:
+                raise
+    buf = io.BytesIO()
+    Image.fromarray(array_uint8).save(buf, format=Image.registered_extensions()[ext.lower()], **encode_kwargs)
+    return buf.getvalue()
 
 def _ensure_uint(img: np.ndarray, bit_depth: int) -> np.ndarray:
     """Ensure integer code values for ITMO. If float, scale to 8-bit by default."""
-    if np.issubdtype(img.dtype, np.integer):
+    # common case first: a PNG decoded at the expected container width
+    if img.dtype == (np.uint16 if bit_depth > 8 else np.uint8):
         return img
-    f = img.astype(np.float64)
-    # assume [0,1] if <=1, otherwise assume already [0,255]
-    if f.max() <= 1.0:
-        f = np.clip(f, 0.0, 1.0) * 255.0
-    return np.round(f).astype(np.uint16 if bit_depth > 8 else np.uint8)
+    if img.dtype.kind in "iu":
+        return img
+    # assume [0,1] if <=1, otherwise assume already [0,255]; the max is the only way to tell
+    # the two conventions apart, so it stays. float32 holds every 8/10-bit code exactly.
+    if img.max() <= 1.0:
+        f = np.clip(img, 0.0, 1.0, dtype=np.float32)  # new buffer: the caller's frame is untouched
+        f *= 255.0
+    else:
+        f = img.astype(np.float32)
+    np.rint(f, out=f)
+    return f.astype(np.uint16 if bit_depth > 8 else np.uint8)
+
+def _list_inputs(in_dir: Path, pattern: str, recursive: bool) -> list:
+    """
+    Sorted input frames whose file name matches `pattern`, listed with os.scandir/os.walk
+    (directory entries only, no per-file stat); Path objects are built once at the end.
+    """
+    if not in_dir.is_dir():  # as Path.glob: nothing matches, main() reports it
+        return []
+    if "/" in pattern or os.sep in pattern:  # patterns spanning directories: let pathlib do it
+        return sorted(in_dir.glob(f"**/{pattern}" if recursive else pattern))
+    if not recursive:
+        with os.scandir(in_dir) as it:
+            names = [e.name for e in it if fnmatch(e.name, pattern) and e.is_file()]
+        names.sort()
+        return [in_dir / n for n in names]
+    found = []
+    for root, _, names in os.walk(in_dir):
+        parts = Path(root).relative_to(in_dir).parts
+        found.extend(parts + (n,) for n in names if fnmatch(n, pattern))
+    found.sort()  # by path components, the same order sorted(Path.glob(...)) gives
+    return [in_dir.joinpath(*p) for p in found]
+
+def _list_tar(tar_path: Path, pattern: str, recursive: bool) -> list:
+    """
+    Sorted (name, data_offset, size) of the regular members of an uncompressed tar whose
+    base name matches `pattern` (top-level members only unless `recursive`). The offsets
+    let workers read members with a seek on their own handle instead of walking the archive.
+    """
+    try:
+        tf = tarfile.open(tar_path, "r:")
+    except tarfile.ReadError as e:
+        raise SystemExit(f"{tar_path}: not an uncompressed tar ({e})")
+    with tf:
+        spans = [(posixpath.normpath(m.name), m.offset_data, m.size) for m in tf if m.isfile()]
+    spans = [s for s in spans if fnmatch(posixpath.basename(s[0]), pattern) and (recursive or "/" not in s[0])]
+    spans.sort()
+    return spans
+
+def _add_to_tar(tf: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tf.addfile(info, io.BytesIO(data))
+
+# ---------- Quantization ----------
+_U8_MAX = np.float32(255.0)
+_ZERO = np.float32(0.0)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _quantize_u8_kernel(src, dst):
+    """dst = uint8(clip(rint(src * 255), 0, 255)) over flat float32 arrays, in one pass."""
+    for i in prange(src.size):
+        v = np.rint(src[i] * _U8_MAX)
+        dst[i] = np.uint8(min(max(v, _ZERO), _U8_MAX))
 
 # ---------- Core processing ----------
+def _import_module(name: str, path: str | None):
+    """Imports module `name`, from the file at `path` if given (sys.path is left alone)."""
+    if not path:
+        return importlib.import_module(name)
+    spec = importlib.util.spec_from_file_location(name, Path(path).resolve())
+    if spec is None:
+        raise ImportError(f"{path} is not a Python module")
+    mod = importlib.util.module_from_spec(spec)
+    # registered under its real name: numba's on-disk kernel cache is keyed by module name
+    sys.modules[name] = mod
+    try:
+        spec.loader.exec_module(mod)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return mod
+
+@lru_cache(maxsize=4)
 def _load_modules(itmo_path: str | None, tmo_path: str | None):
-    if itmo_path:
-        itmo_dir = str(Path(itmo_path).resolve().parent)
-        if itmo_dir not in sys.path: sys.path.insert(0, itmo_dir)
-    if tmo_path:
-        tmo_dir = str(Path(tmo_path).resolve().parent)
-        if tmo_dir not in sys.path: sys.path.insert(0, tmo_dir)
     try:
-        from proposed_itmo import proposed_itmo
+        proposed_itmo = _import_module("proposed_itmo", itmo_path).proposed_itmo
     except Exception as e:
         raise ImportError("Could not import proposed_itmo. Use --itmo-path to point to proposed_itmo.py") from e
     try:
-        from proposed_tmo import proposed_tmo
+        proposed_tmo = _import_module("proposed_tmo", tmo_path).proposed_tmo
     except Exception as e:
         raise ImportError("Could not import proposed_tmo. Use --tmo-path to point to proposed_tmo.py") from e
     return proposed_itmo, proposed_tmo
 
-def process_one_file(in_path: Path, out_path: Path, *,
-                     bit_depth: int, wB: float, wC: float,
-                     mapping_curve: str, save_hdr_npy_dir: Path | None,
-                     itmo, tmo):
-    sdr = _read_image(str(in_path))
+@lru_cache(maxsize=None)
+def _accepts_out(fn) -> bool:
+    """Whether the operator takes an out= array to write its result into."""
+    try:
+        return "out" in inspect.signature(fn).parameters
+    except (TypeError, ValueError):  # no introspectable signature
+        return False
+
+def _load_sdr(in_path: Path, bit_depth: int, span: tuple | None = None) -> np.ndarray:
+    # span = (offset, size) of the frame inside the worker's --input-tar
+    sdr = _read_image(io.BytesIO(_read_member(*span)) if span else str(in_path))
     sdr = _ensure_uint(sdr, bit_depth)
 
     # after reading 'img' as a numpy array
     if sdr.ndim == 2:                 # grayscale → RGB
-        sdr = np.repeat(sdr[..., None], 3, axis=2)
+        # read-only broadcast view, no copy: ITMO only reads its input frame
+        sdr = np.broadcast_to(sdr[..., None], sdr.shape + (3,))
+    return sdr
 
+def _convert(sdr: np.ndarray, in_path: Path, *,
+             bit_depth: int, wB: float, wC: float,
+             mapping_curve: str, save_hdr_npy_dir: Path | None,
+             itmo, tmo, save_hdr: bool = True, out: np.ndarray | None = None) -> np.ndarray:
 
     # SDR -> HDR (PQ/BT.2020) via ITMO
-    hdr_pq_2020 = itmo(sdr, input_bit_depth=bit_depth, wB=wB, wC=wC)
-
-    # Optionally save intermediate HDR as .npy
-    if save_hdr_npy_dir is not None:
-        save_hdr_npy_dir.mkdir(parents=True, exist_ok=True)
-        np.save(save_hdr_npy_dir / (in_path.stem + "_hdr_pq2020.npy"), hdr_pq_2020)
+    if save_hdr_npy_dir is not None and save_hdr:
+        # Save the intermediate HDR as .npy (plain array, no pickle): ITMO writes straight into
+        # the mapped file, so the frame is held once, in the page cache, not also in a private array
+        npy = save_hdr_npy_dir / (in_path.stem + "_hdr_pq2020.npy")
+        # ITMO returns R, G, B whatever the input carries (e.g. an RGBA PNG)
+        hdr_pq_2020 = np.lib.format.open_memmap(npy, mode="w+", dtype=np.float32, shape=sdr.shape[:-1] + (3,))
+        try:
+            if _accepts_out(itmo):
+                itmo(sdr, input_bit_depth=bit_depth, wB=wB, wC=wC, out=hdr_pq_2020)
+            else:  # an --itmo-path operator without out=
+                hdr_pq_2020[...] = itmo(sdr, input_bit_depth=bit_depth, wB=wB, wC=wC)
+        except BaseException:
+            del hdr_pq_2020
+            npy.unlink(missing_ok=True)  # no half-written .npy left behind
+            raise
+    else:
+        hdr_pq_2020 = itmo(sdr, input_bit_depth=bit_depth, wB=wB, wC=wC)
+        # the bundled ITMO already returns float32; a float64 one (--itmo-path) is narrowed
+        # here so every TMO temporary is half the size
+        if hdr_pq_2020.dtype == np.float64:
+            hdr_pq_2020 = hdr_pq_2020.astype(np.float32)
 
     # HDR PQ -> SDR (BT.709, gamma-encoded) via TMO
-    sdr_out = tmo(hdr_pq_2020, MappingCurve=mapping_curve)
+    sdr_out = tmo(hdr_pq_2020, mappingCurve=mapping_curve)
+
+    # Quantize to 8-bit into `out` (a recycled buffer of the same shape, else a new one):
+    # one fused pass with numba, else in place on the fresh float32 frame tmo() hands back
+    sdr_out = np.ascontiguousarray(sdr_out, dtype=np.float32)
+    if out is None or out.shape != sdr_out.shape:
+        out = np.empty(sdr_out.shape, dtype=np.uint8)
+    if _HAVE_NUMBA:
+        _quantize_u8_kernel(sdr_out.reshape(-1), out.reshape(-1))
+        return out
+    sdr_out *= 255.0
+    np.rint(sdr_out, out=sdr_out)
+    np.clip(sdr_out, 0, 255, out=sdr_out)
+    np.copyto(out, sdr_out, casting="unsafe")
+    return out
+
+# ---------- Worker pool ----------
+# Each worker imports the operators and receives the run config once in its initializer;
+# tasks only carry contiguous shards of (in_path, out_path, save_hdr, tar_span).
+_itmo = None
+_tmo = None
+_params = {}
+_encode = {}
+_to_bytes = False  # --output-tar: hand encoded frames back to the parent, which owns the archive
+_tar = None  # --input-tar: one handle per worker, shared by the reader threads
+_tar_lock = threading.Lock()
+_SHARD = 16  # minimum frames per pool task
+_SHARDS_PER_WORKER = 4  # a few per worker keeps the load balanced and progress flowing
+
+# BLAS/OpenMP pool sizes read by libraries imported in a spawned (not forked) worker
+_THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+def _usable_cpus() -> int:
+    """CPUs this process may run on (its affinity mask, e.g. under taskset or a container)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _limit_threads(n: int):
+    """Caps this process's native thread pools (OpenCV, numba, BLAS/OpenMP) at n threads."""
+    if cv2 is not None:
+        cv2.setNumThreads(n)
+    if _HAVE_NUMBA:
+        numba.set_num_threads(min(n, numba.config.NUMBA_NUM_THREADS))
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:  # optional; the env vars above cover spawned workers
+        return
+    threadpool_limits(n)
+
+def _worker_init(itmo_path: str | None, tmo_path: str | None, params: dict, encode_kwargs: dict,
+                 input_tar: str | None = None, to_bytes: bool = False, threads: int | None = None):
+    global _itmo, _tmo, _params, _encode, _tar, _to_bytes
+    if threads is not None:  # N workers x all-core pools each would oversubscribe the CPU
+        _limit_threads(threads)
+    _itmo, _tmo = _load_modules(itmo_path, tmo_path)
+    _params, _encode, _to_bytes = params, encode_kwargs, to_bytes
+    if input_tar:
+        _tar = open(input_tar, "rb")
+    if _HAVE_NUMBA:  # compile (or load from the cache) once, before the first frame
+        _quantize_u8_kernel(np.zeros(1, dtype=np.float32), np.empty(1, dtype=np.uint8))
+
+def _read_member(offset: int, size: int) -> bytes:
+    with _tar_lock:  # seek + read must not interleave between reader threads
+        _tar.seek(offset)
+        return _tar.read(size)
 
-    # Save as 8-bit
-    sdr_u8 = np.clip(np.round(sdr_out * 255.0), 0, 255).astype(np.uint8)
-    _write_image(str(out_path), sdr_u8)
+def _process_shard(jobs: list) -> tuple:
+    """
+    Runs read -> ITMO/TMO -> write over jobs [(in_path, out_path, save_hdr, tar_span), ...] with decode on reader
+    threads and encode on a writer thread, so the worker's compute overlaps both. Bounded
+    queues cap the frames in flight; None is the poison pill ending each stage. The writer
+    hands finished uint8 buffers back through `free`, so same-size frames reuse them.
+    Returns (errors, blobs) in job order: the error message per job (None on success) and,
+    with --output-tar, the encoded frame bytes per job (else None).
+    """
+    errors = [None] * len(jobs)
+    blobs = [None] * len(jobs)
+    read_q = queue.Queue(maxsize=4)
+    write_q = queue.Queue(maxsize=4)
+    free = queue.Queue()  # uint8 output buffers the writer is done with
+    readers = ThreadPoolExecutor(max_workers=2)
+
+    def feed():
+        for i, (ip, _, _, span) in enumerate(jobs):
+            read_q.put((i, readers.submit(_load_sdr, ip, _params["bit_depth"], span)))
+        read_q.put(None)
+
+    def drain():
+        while (job := write_q.get()) is not None:
+            i, op, sdr_u8 = job
+            try:
+                if _to_bytes:
+                    blobs[i] = _encode_image(sdr_u8, Path(op).suffix, **_encode)
+                else:
+                    _write_image(str(op), sdr_u8, **_encode)
+            except Exception as e:
+                errors[i] = str(e)
+            finally:
+                free.put(sdr_u8)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    writer = threading.Thread(target=drain, daemon=True)
+    feeder.start()
+    writer.start()
+    try:
+        while (job := read_q.get()) is not None:
+            i, fut = job
+            ip, op, save_hdr, _ = jobs[i]
+            try:
+                buf = free.get_nowait()
+            except queue.Empty:
+                buf = None
+            try:
+                sdr_u8 = _convert(fut.result(), ip, itmo=_itmo, tmo=_tmo, save_hdr=save_hdr, out=buf, **_params)
+            except Exception as e:
+                errors[i] = str(e)
+                continue
+            write_q.put((i, op, sdr_u8))
+    finally:
+        write_q.put(None)
+        writer.join()
+        readers.shutdown(wait=False, cancel_futures=True)
+    return errors, blobs
 
 def main():
     p = argparse.ArgumentParser(description="SDR -> HDR (ProposedITMO) -> SDR (ProposedTMO) pipeline")
 
     p.add_argument("--input-dir", help="Directory containing SDR frames")
     p.add_argument("--output-dir", help="Directory to write SDR outputs")
-    p.add_argument("--glob", default="*.png", help="Glob for input-dir (default: *.png)")
+    p.add_argument("--input-tar", help="Uncompressed .tar of SDR frames, read in place (instead of --input-dir)")
+    p.add_argument("--output-tar", help="Write SDR outputs into this .tar (instead of --output-dir)")
+    p.add_argument("--glob", default="*.png", help="Glob for input-dir / input-tar member names (default: *.png)")
     p.add_argument("--recursive", action="store_true", help="Recurse into subfolders")
-    p.add_argument("--output-ext", default=".png", help="Output extension for directory mode (default: .png)")
+    p.add_argument("--output-ext", default=".png", help="Output extension for directory mode (default: .png; .jpg is written at quality 90)")
+    p.add_argument("--png-compress", type=int, default=1, help="zlib level for .png outputs, 0-9 (default: 1)")
     p.add_argument("--overwrite", action="store_true", help="Overwrite existing outputs")
 
     # Processing params
@@ -93,44 +424,100 @@ def main():
     p.add_argument("--wC", type=float, default=0.5, help="ITMO contrast weight (default 1.0)")
     p.add_argument("--mapping-curve", default="PiecewiseLinear", choices=["Gamma","PiecewiseLinear"], help="TMO mapping curve")
     p.add_argument("--save-hdr-npy-dir", default=None, help="Optional dir to save intermediate HDR PQ/BT.2020 as .npy")
+    p.add_argument("--save-hdr-every", type=int, default=1,
+                   help="With --save-hdr-npy-dir, save every Nth frame of the sorted input (default 1 = all, 0 = none)")
 
     # Module paths
     p.add_argument("--itmo-path", default=None, help="Path to proposed_itmo.py if not importable")
     p.add_argument("--tmo-path", default=None, help="Path to proposed_tmo.py if not importable")
+    p.add_argument("--jobs", type=int, default=_usable_cpus(), help="Worker processes (default: all usable cores)")
     args = p.parse_args()
 
-    itmo, tmo = _load_modules(args.itmo_path, args.tmo_path)
+    # fail fast here on a bad --itmo-path/--tmo-path; the workers import their own copies
+    _load_modules(args.itmo_path, args.tmo_path)
 
     # Optional HDR save dir
     save_hdr_dir = Path(args.save_hdr_npy_dir) if args.save_hdr_npy_dir else None
+    if save_hdr_dir is not None and args.save_hdr_every > 0:
+        save_hdr_dir.mkdir(parents=True, exist_ok=True)
+
+    if not (args.input_dir or args.input_tar) or not (args.output_dir or args.output_tar):
+        p.error("need --input-dir or --input-tar, and --output-dir or --output-tar")
+    if args.output_tar and Path(args.output_tar).exists() and not args.overwrite:
+        p.error(f"{args.output_tar} exists (use --overwrite)")
 
-    # Directory mode
-    in_dir  = Path(args.input_dir)
-    out_dir = Path(args.output_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    # Directory or tar mode; a tar member's name is its relative path
     pattern = f"**/{args.glob}" if args.recursive else args.glob
-    files = sorted(in_dir.glob(pattern))
+    if args.input_tar:
+        in_dir = Path(args.input_tar)
+        spans = _list_tar(in_dir, args.glob, args.recursive)
+        inputs = [(Path(name), Path(name), (offset, size)) for name, offset, size in spans]
+    else:
+        in_dir = Path(args.input_dir)
+        files = _list_inputs(in_dir, args.glob, args.recursive)
+        inputs = [(ip, ip.relative_to(in_dir) if args.recursive else Path(ip.name), None) for ip in files]
 
-    if not files:
+    if not inputs:
         print(f"[warn] No files matched {pattern} in {in_dir}")
         return
 
-    for ip in files:
-        rel = ip.relative_to(in_dir) if args.recursive else Path(ip.name)
+    out_dir = None
+    if not args.output_tar:
+        out_dir = Path(args.output_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    # output directories are created here, once each, not per frame by the workers
+    made = {out_dir}
+    todo = []
+    for idx, (ip, rel, span) in enumerate(inputs):
         out_rel = rel.with_suffix(args.output_ext)
-        op = out_dir / out_rel
-        if op.exists() and not args.overwrite:
-            print(f"[skip] {rel} -> {out_rel} (exists)")
-            continue
-        try:
-            process_one_file(ip, op,
-                             bit_depth=args.bit_depth, wB=args.wB, wC=args.wC,
-                             mapping_curve=args.mapping_curve,
-                             save_hdr_npy_dir=save_hdr_dir,
-                             itmo=itmo, tmo=tmo)
-            print(f"[ok] {rel} -> {out_rel}")
-        except Exception as e:
-            print(f"[err] {rel}: {e}")
+        if out_dir is None:
+            op = out_rel  # archive member name
+        else:
+            op = out_dir / out_rel
+            if not args.overwrite and os.path.exists(op):
+                print(f"[skip] {rel} -> {out_rel} (exists)")
+                continue
+            if op.parent not in made:
+                op.parent.mkdir(parents=True, exist_ok=True)
+                made.add(op.parent)
+        save_hdr = args.save_hdr_every > 0 and idx % args.save_hdr_every == 0
+        todo.append((ip, op, save_hdr, span, rel, out_rel))
+
+    encode_kwargs = _encode_kwargs(args.output_ext, args.png_compress)
+    params = dict(bit_depth=args.bit_depth, wB=args.wB, wC=args.wC,
+                  mapping_curve=args.mapping_curve,
+                  save_hdr_npy_dir=save_hdr_dir)
+    jobs_n = max(1, args.jobs)
+    threads = max(1, _usable_cpus() // jobs_n)
+    for var in _THREAD_ENV:
+        os.environ.setdefault(var, str(threads))
+    shard = max(_SHARD, -(-len(todo) // (jobs_n * _SHARDS_PER_WORKER)))
+    # only this process writes the output archive; members land in shard completion order
+    out_tar = tarfile.open(args.output_tar, "w") if args.output_tar else None
+    with ProcessPoolExecutor(max_workers=jobs_n, initializer=_worker_init,
+                             initargs=(args.itmo_path, args.tmo_path, params, encode_kwargs,
+                                       args.input_tar, out_tar is not None, threads)) as ex:
+        futures = {}
+        for k in range(0, len(todo), shard):
+            chunk = todo[k:k + shard]
+            jobs = [(ip, op, save_hdr, span) for ip, op, save_hdr, span, _, _ in chunk]
+            futures[ex.submit(_process_shard, jobs)] = chunk
+        for fut in as_completed(futures):
+            chunk = futures[fut]
+            try:
+                errors, blobs = fut.result()
+            except Exception as e:  # the worker itself died
+                errors, blobs = [str(e)] * len(chunk), [None] * len(chunk)
+            for (_, op, _, _, rel, out_rel), err, blob in zip(chunk, errors, blobs):
+                if err is None:
+                    if out_tar is not None:
+                        _add_to_tar(out_tar, op.as_posix(), blob)
+                    print(f"[ok] {rel} -> {out_rel}")
+                else:
+                    print(f"[err] {rel}: {err}")
+    if out_tar is not None:
+        out_tar.close()
 
 if __name__ == "__main__":
     main()